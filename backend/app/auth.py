@@ -1,3 +1,4 @@
+import hmac
 from datetime import datetime, timedelta, timezone
 
 from fastapi import APIRouter, HTTPException
@@ -8,9 +9,8 @@ from .config import (
     SECRET_KEY,
     JWT_ALGORITHM,
     JWT_EXPIRE_HOURS,
-    get_user_workdir,
-    find_user,
 )
+from .services.user_registry import registry
 
 router = APIRouter()
 
@@ -28,13 +28,14 @@ class LoginResponse(BaseModel):
 
 @router.post("/api/login", response_model=LoginResponse)
 async def login(req: LoginRequest):
-    user = find_user(req.uid)
-    if not user or user.get("password") != req.password:
+    user = registry.get(req.uid)
+    if not user or not hmac.compare_digest(
+        str(user.get("password", "")).encode(), req.password.encode()
+    ):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     # Ensure user workdir exists
-    workdir = get_user_workdir(req.uid)
-    workdir.mkdir(parents=True, exist_ok=True)
+    registry.ensure_workdir(req.uid)
 
     exp = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRE_HOURS)
     token = jwt.encode(
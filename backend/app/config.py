@@ -1,36 +1,112 @@
+import logging
 import os
 from pathlib import Path
 
 import yaml
 
+# libyaml 可用时用 C 实现解析，大文件快一个数量级
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 SECRET_KEY = os.getenv("JWT_SECRET", "claudecohub-dev-secret-change-me")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRE_HOURS = 24
+# 已验证 token 的缓存条数上限（LRU）
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
 
 WORKDIR_BASE = Path.home() / "workdir"
 
 CLAUDE_PROJECTS_DIR = Path.home() / ".claude" / "projects"
+# 用户级 Claude Code 设置，状态上报钩子安装在这里
+CLAUDE_SETTINGS_FILE = Path.home() / ".claude" / "settings.json"
 
 SCHEDULES_DIR = Path.home() / ".claude" / "claudecohub"
 
 USERS_FILE = SCHEDULES_DIR / "users.yaml"
+# 账号文件变更检查的最小间隔（秒）
+USERS_RELOAD_INTERVAL = float(os.getenv("USERS_RELOAD_INTERVAL", "1"))
+
+# 后台轮询 tmux 会话状态的间隔（秒）
+STATUS_POLL_INTERVAL = float(os.getenv("STATUS_POLL_INTERVAL", "2"))
+
+# 通过常驻的 tmux 控制模式 (tmux -C) 连接发送命令；关闭后每条命令单独 exec
+TMUX_CONTROL_MODE = os.getenv("TMUX_CONTROL_MODE", "1") != "0"
+# 同时运行的 tmux 子进程上限（exec 回退路径）
+TMUX_MAX_CONCURRENCY = int(os.getenv("TMUX_MAX_CONCURRENCY", "8"))
+
+# 扫描会话文件的线程池大小，以及全局总览的分页大小和单页时间预算（秒）
+DISCOVERY_WORKERS = int(os.getenv("DISCOVERY_WORKERS", "8"))
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+ADMIN_TIME_BUDGET = float(os.getenv("ADMIN_TIME_BUDGET", "2"))
+
+# 周期任务执行：全局并发上限、每用户并发上限、触发后的随机延迟（秒），
+# 以及排队超过多久视为错过（秒）
+TASK_MAX_CONCURRENCY = int(os.getenv("TASK_MAX_CONCURRENCY", "4"))
+TASK_MAX_PER_USER = int(os.getenv("TASK_MAX_PER_USER", "1"))
+TASK_JITTER = float(os.getenv("TASK_JITTER", "30"))
+TASK_MISFIRE_GRACE = float(os.getenv("TASK_MISFIRE_GRACE", "3600"))
+
+# 周期任务输出日志：单次运行上限、每个任务保留的总量、保留天数，
+# 以及结束后超过多大才压缩（字节）
+TASK_LOG_MAX_RUN_BYTES = int(os.getenv("TASK_LOG_MAX_RUN_BYTES", str(512 * 1024 * 1024)))
+TASK_LOG_KEEP_BYTES = int(os.getenv("TASK_LOG_KEEP_BYTES", str(1024 * 1024 * 1024)))
+TASK_LOG_MAX_AGE_DAYS = float(os.getenv("TASK_LOG_MAX_AGE_DAYS", "30"))
+TASK_LOG_COMPRESS_MIN_BYTES = int(os.getenv("TASK_LOG_COMPRESS_MIN_BYTES", "4096"))
+
+# 终端输出合帧：时间窗口（秒）、单帧上限（字节），以及暂停读取 PTY 的积压高水位
+TERMINAL_FRAME_INTERVAL = float(os.getenv("TERMINAL_FRAME_INTERVAL", "0.012"))
+TERMINAL_FRAME_MAX_BYTES = int(os.getenv("TERMINAL_FRAME_MAX_BYTES", str(64 * 1024)))
+TERMINAL_HIGH_WATER = int(os.getenv("TERMINAL_HIGH_WATER", str(256 * 1024)))
+
+# 浏览会话记录时单行的解析上限（字节），超过的行只报告大小
+TRANSCRIPT_MAX_LINE_BYTES = int(os.getenv("TRANSCRIPT_MAX_LINE_BYTES", str(1024 * 1024)))
+
+# 全文检索索引的增量更新间隔（秒，仅在没有文件监听时使用），以及每条消息最多索引的字符数
+SEARCH_INDEX_INTERVAL = float(os.getenv("SEARCH_INDEX_INTERVAL", "60"))
+SEARCH_MAX_TEXT_CHARS = int(os.getenv("SEARCH_MAX_TEXT_CHARS", "32768"))
+
+# 会话文件监听：优先 inotify，不可用时按间隔轮询（秒）；事件合并窗口（秒）
+WATCH_USE_INOTIFY = os.getenv("WATCH_USE_INOTIFY", "1") != "0"
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "1"))
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "0.1"))
+
+# 终端画面快照/预览的缓存时间（秒），窗格有输出时提前失效
+SNAPSHOT_CACHE_TTL = float(os.getenv("SNAPSHOT_CACHE_TTL", "2"))
+
+# 日志级别；/metrics 端点与内部计时默认关闭
+LOG_LEVEL = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+
+# 用量汇总的增量更新间隔（秒，仅在没有文件监听时使用）
+USAGE_UPDATE_INTERVAL = float(os.getenv("USAGE_UPDATE_INTERVAL", "60"))
+
+# 空闲会话回收：检查间隔（秒）；空闲不足 SESSION_MIN_IDLE 秒的会话从不回收。
+# 空闲超时、每用户/全局存活上限为 0 表示不限；可用内存低于该百分比时按 LRU 逐个回收
+REAPER_INTERVAL = float(os.getenv("REAPER_INTERVAL", "30"))
+SESSION_MIN_IDLE = float(os.getenv("SESSION_MIN_IDLE", "600"))
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "0"))
+SESSION_MAX_PER_USER = int(os.getenv("SESSION_MAX_PER_USER", "0"))
+SESSION_MAX_TOTAL = int(os.getenv("SESSION_MAX_TOTAL", "0"))
+REAPER_MIN_FREE_MEM_PERCENT = float(os.getenv("REAPER_MIN_FREE_MEM_PERCENT", "10"))
+
+# 预热会话池：每个活跃用户预先启动的会话数（默认 0 关闭；每个预热会话都常驻一个 claude 进程），
+# 用户多久没访问后不再预热（秒），以及预热会话的最长保留时间（秒），过期后重启以加载新的设置
+POOL_SIZE = int(os.getenv("POOL_SIZE", "0"))
+POOL_ACTIVE_WINDOW = float(os.getenv("POOL_ACTIVE_WINDOW", "3600"))
+POOL_MAX_AGE = float(os.getenv("POOL_MAX_AGE", "21600"))
+
+# 会话状态由 Claude Code 钩子经本地 Unix 套接字上报；关闭后卸载钩子，只靠抓取窗格文字判断
+STATUS_HOOKS = os.getenv("STATUS_HOOKS", "1") != "0"
+STATUS_HOOK_SOCKET = Path(os.getenv("STATUS_HOOK_SOCKET", str(SCHEDULES_DIR / "status.sock")))
 
 
 def load_users() -> list[dict]:
     if not USERS_FILE.exists():
         return []
     with open(USERS_FILE) as f:
-        data = yaml.safe_load(f)
+        data = yaml.load(f, Loader=YAML_LOADER)
     return data if isinstance(data, list) else []
 
 
-def find_user(uid: str) -> dict | None:
-    for u in load_users():
-        if u.get("uid") == uid:
-            return u
-    return None
-
-
 def get_user_workdir(uid: str) -> Path:
     return WORKDIR_BASE / uid
 
@@ -1,28 +1,90 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
 from fastapi import Depends, HTTPException, Query
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 
-from .config import SECRET_KEY, JWT_ALGORITHM
+from .config import SECRET_KEY, JWT_ALGORITHM, TOKEN_CACHE_SIZE, get_user_workdir
+from .services.user_registry import registry
 
 security = HTTPBearer()
 
 
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated caller, resolved once per token."""
+
+    uid: str
+    username: str
+    workdir: str
+    # users.yaml 中 admin: true 的用户可以看到所有人的会话
+    admin: bool = False
+
+
+# token 摘要 -> (principal, exp 时间戳, 签发时对应的用户记录)
+_cache: "OrderedDict[bytes, tuple[Principal, float, dict]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-) -> str:
-    return _decode_token(credentials.credentials)
+) -> Principal:
+    return _authenticate(credentials.credentials)
 
 
-def get_current_user_ws(token: str = Query(...)) -> str:
-    return _decode_token(token)
+def get_current_user_ws(token: str = Query(...)) -> Principal:
+    return _authenticate(token)
 
 
-def _decode_token(token: str) -> str:
+def _decode_token(token: str) -> tuple[str, float]:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        uid: str = payload.get("sub")
-        if uid is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return uid
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    uid = payload.get("sub")
+    exp = payload.get("exp")
+    if uid is None or not isinstance(exp, (int, float)):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return str(uid), float(exp)
+
+
+def _authenticate(token: str) -> Principal:
+    """Resolve a bearer token to a Principal.
+
+    Verified tokens are cached by digest until their own `exp`, in an LRU
+    capped at TOKEN_CACHE_SIZE. Every hit still checks the user registry, so
+    a user removed from users.yaml is rejected on the next request.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+    if hit is not None:
+        principal, exp, user = hit
+        if now < exp and registry.get(principal.uid) is user:
+            return principal
+        # 过期，或用户被删除/修改：丢弃缓存，重新完整校验
+        with _cache_lock:
+            _cache.pop(key, None)
+
+    uid, exp = _decode_token(token)
+    user = registry.get(uid)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    principal = Principal(
+        uid=uid,
+        username=str(user.get("username", uid)),
+        workdir=str(get_user_workdir(uid)),
+        admin=user.get("admin") is True,
+    )
+    with _cache_lock:
+        _cache[key] = (principal, exp, user)
+        while len(_cache) > TOKEN_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return principal
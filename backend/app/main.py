@@ -11,22 +11,62 @@ from .routers.sessions import router as sessions_router
 from .routers.terminal import router as terminal_router
 from .routers.schedules import router as schedules_router
 from .routers.admin import router as admin_router
+from .routers.search import router as search_router
+from .routers.metrics import router as metrics_router
+from .routers.usage import router as usage_router
+from .config import LOG_LEVEL, METRICS_ENABLED
 from .services.scheduler import scheduler, reload_schedules
+from .services import (
+    tmux, status_monitor, pty_lifecycle, terminal_hub, search_index, fs_watcher, claude_session,
+    metrics, usage, session_reaper, session_pool, status_hooks,
+)
+from .services.task_runner import runner
+from .services.user_registry import registry
 
 
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=LOG_LEVEL)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    registry.all()
     reload_schedules()
+    runner.start()
     scheduler.start()
+    await tmux.start()
+    await pty_lifecycle.cleanup_orphans()
+    await status_hooks.start()
+    await status_monitor.start()
+    fs_watcher.subscribe(claude_session.apply_changes)
+    fs_watcher.subscribe(status_monitor.apply_changes)
+    fs_watcher.subscribe(search_index.apply_changes)
+    fs_watcher.subscribe(usage.apply_changes)
+    await fs_watcher.start()
+    search_index.start()
+    usage.start()
+    session_reaper.start()
+    await session_pool.start()
+    metrics.start()
     yield
+    await metrics.stop()
+    await session_pool.stop()
+    await session_reaper.stop()
+    await usage.stop()
+    await search_index.stop()
+    await fs_watcher.stop()
+    await status_monitor.stop()
+    await status_hooks.stop()
+    await terminal_hub.close_all()
+    await tmux.stop()
     scheduler.shutdown(wait=False)
+    await runner.stop()
 
 
 app = FastAPI(title="ClaudeCoHub", lifespan=lifespan)
 
+if METRICS_ENABLED:
+    app.add_middleware(metrics.RequestTimer)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -40,6 +80,9 @@ app.include_router(sessions_router)
 app.include_router(terminal_router)
 app.include_router(schedules_router)
 app.include_router(admin_router)
+app.include_router(search_router)
+app.include_router(metrics_router)
+app.include_router(usage_router)
 
 # Mount frontend static files last (catch-all)
 frontend_dir = Path(__file__).resolve().parent.parent.parent / "frontend"
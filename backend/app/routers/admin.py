@@ -1,41 +1,117 @@
-from fastapi import APIRouter, Depends
+import asyncio
+from typing import Optional
 
-from ..deps import get_current_user
-from ..config import WORKDIR_BASE
-from ..services import tmux, claude_session
+from fastapi import APIRouter, Depends, Query
+
+from ..deps import Principal, get_current_user
+from ..config import ADMIN_PAGE_SIZE, ADMIN_TIME_BUDGET
+from ..services import tmux, claude_session, status_monitor, usage, session_pool
 from ..services.scheduler import load_schedules
+from ..services.task_runner import runner
+from ..services.transcript_index import list_usernames
 
 router = APIRouter()
 
 
 @router.get("/api/admin/overview")
-async def admin_overview(uid: str = Depends(get_current_user)):
-    alive_sessions = await tmux.list_tmux_sessions()
+async def admin_overview(
+    user: Principal = Depends(get_current_user),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=500),
+    budget: Optional[float] = Query(None, gt=0, description="Time budget in seconds"),
+):
+    """One page of users with their sessions.
+
+    Users are scanned concurrently on the discovery pool. If the time budget
+    runs out, the page is cut short after the last user finished in order,
+    `partial` is set and `next_offset` resumes from there; scans still in
+    flight keep warming the session index for the next request.
+    """
+    loop = asyncio.get_running_loop()
+    usernames = await loop.run_in_executor(None, list_usernames)
+    page = usernames[offset:offset + limit]
+
+    tasks = [
+        asyncio.ensure_future(claude_session.discover_sessions_async(uname))
+        for uname in page
+    ]
+    if tasks:
+        await asyncio.wait(tasks, timeout=budget or ADMIN_TIME_BUDGET)
 
+    try:
+        totals = {
+            row["username"]: row
+            for row in await usage.rollup_async("user", page)
+        }
+    except Exception:
+        totals = {}
+
+    statuses = status_monitor.snapshot()
     users = []
-    if WORKDIR_BASE.exists():
-        for user_dir in sorted(WORKDIR_BASE.iterdir()):
-            if not user_dir.is_dir():
-                continue
-            uname = user_dir.name
-            discovered = claude_session.discover_sessions(uname)
-            sessions = []
-            for s in discovered:
-                sid = s["session_id"]
-                alive = sid in alive_sessions
-                status = None
-                if alive:
-                    status = await tmux.detect_status(sid)
-                sessions.append({
-                    "session_id": sid,
-                    "first_message": s.get("first_message", ""),
-                    "updated_at": s["updated_at"],
-                    "status": status or ("idle" if alive else "dead"),
-                })
-            users.append({
-                "username": uname,
-                "sessions": sessions,
+    for uname, task in zip(page, tasks):
+        if not task.done():
+            break
+        try:
+            discovered = task.result()
+        except OSError:
+            discovered = []
+        sessions = []
+        for s in discovered:
+            sid = s["session_id"]
+            alive = sid in statuses
+            status = statuses.get(sid)
+            sessions.append({
+                "session_id": sid,
+                "first_message": s.get("first_message", ""),
+                "updated_at": s["updated_at"],
+                "status": status or ("idle" if alive else "dead"),
             })
+        row = totals.get(uname)
+        users.append({
+            "username": uname,
+            "sessions": sessions,
+            "usage": {
+                "total_tokens": row["total_tokens"], "cost": row["cost"],
+            } if row else None,
+        })
+
+    next_offset = offset + len(users)
+    result = {
+        "users": users,
+        "total": len(usernames),
+        "next_offset": next_offset if next_offset < len(usernames) else None,
+        "partial": len(users) < len(page),
+    }
+    if offset == 0:
+        result["schedules"] = load_schedules()
+    return result
+
+
+@router.get("/api/admin/tmux")
+async def admin_tmux_metrics(user: Principal = Depends(get_current_user)):
+    return tmux.metrics()
+
+
+@router.get("/api/admin/pool")
+async def admin_pool_stats(user: Principal = Depends(get_current_user)):
+    return session_pool.stats()
+
+
+@router.get("/api/admin/usage")
+async def admin_usage(
+    group: str = Query("user", pattern="^(user|session|schedule|model|day|hour)$"),
+    username: Optional[str] = None,
+    since: Optional[str] = Query(None, description="ISO time, e.g. 2026-10-01"),
+    until: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    user: Principal = Depends(get_current_user),
+):
+    """Token and cost rollups across all users."""
+    return await usage.rollup_async(
+        group, [username] if username else None, since, until, limit
+    )
+
 
-    schedules = load_schedules()
-    return {"users": users, "schedules": schedules}
+@router.get("/api/admin/tasks")
+async def admin_task_stats(user: Principal = Depends(get_current_user)):
+    return runner.stats()
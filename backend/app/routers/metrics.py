@@ -0,0 +1,60 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from ..config import METRICS_ENABLED
+from ..services import metrics, session_pool, status_monitor, terminal_hub, tmux
+from ..services.task_runner import runner
+
+router = APIRouter()
+
+
+def _samples():
+    tmux_metrics = sorted(tmux.metrics().items())
+    for command, m in tmux_metrics:
+        for transport in ("control", "exec"):
+            yield ("claudecohub_tmux_commands_total", "counter",
+                   "tmux commands run, by command and transport.",
+                   {"command": command, "transport": transport}, m[transport])
+    for command, m in tmux_metrics:
+        yield ("claudecohub_tmux_errors_total", "counter",
+               "tmux commands that returned non-zero.", {"command": command}, m["errors"])
+    for command, m in tmux_metrics:
+        yield ("claudecohub_tmux_seconds_total", "counter",
+               "Time spent in tmux commands.", {"command": command}, m["total_seconds"])
+
+    hub = terminal_hub.stats()
+    yield ("claudecohub_terminals", "gauge", "Shared tmux attach clients (PTY bridges).", {}, hub["terminals"])
+    yield ("claudecohub_terminal_viewers", "gauge", "Terminal WebSocket viewers.", {}, hub["viewers"])
+    yield ("claudecohub_terminal_send_queue_bytes_max", "gauge",
+           "Largest unsent backlog of any terminal viewer.", {}, hub["pending_bytes_max"])
+    yield ("claudecohub_terminal_send_queue_frames_max", "gauge",
+           "Most queued frames of any terminal viewer.", {}, hub["pending_frames_max"])
+
+    status = status_monitor.stats()
+    yield ("claudecohub_status_subscribers", "gauge", "Status WebSocket subscribers.", {}, status["subscribers"])
+    yield ("claudecohub_status_queue_max", "gauge",
+           "Deepest status WebSocket send queue.", {}, status["queue_max"])
+    yield ("claudecohub_status_hook_sessions", "gauge",
+           "Sessions whose status comes from hooks rather than pane capture.", {}, status["reported"])
+
+    pool = session_pool.stats()
+    yield ("claudecohub_pool_warm_sessions", "gauge", "Pre-started sessions waiting to be handed out.", {}, pool["warm"])
+    for event in ("hits", "misses", "started", "discarded"):
+        yield ("claudecohub_pool_events_total", "counter",
+               "Session pool events: hits and misses on create, sessions pre-started and discarded.",
+               {"event": event}, pool[event])
+
+    tasks = runner.stats()
+    yield ("claudecohub_tasks_queued", "gauge", "Scheduled tasks waiting to run.", {}, tasks["queued"])
+    yield ("claudecohub_tasks_running", "gauge", "Scheduled tasks running.", {}, tasks["running"])
+    for event in ("submitted", "coalesced", "misfired", "completed", "failed"):
+        yield ("claudecohub_tasks_total", "counter", "Scheduled task events.", {"event": event}, tasks[event])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(
+        metrics.render(_samples()), media_type="text/plain; version=0.0.4"
+    )
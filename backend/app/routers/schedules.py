@@ -1,14 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 
-from ..deps import get_current_user
-from ..config import get_user_workdir
+from ..deps import Principal, get_current_user
 from ..services.scheduler import (
     load_schedules,
-    save_schedules,
     reload_schedules,
 )
+from ..services import schedule_store, task_logs
 
 router = APIRouter()
 
@@ -26,20 +28,46 @@ class ScheduleUpdate(BaseModel):
     enabled: Optional[bool] = None
 
 
+def _add(workdir: str, new_schedule: dict):
+    with schedule_store.modify(workdir) as schedules:
+        if any(s["name"] == new_schedule["name"] for s in schedules):
+            raise HTTPException(status_code=400, detail="Schedule name already exists")
+        schedules.append(new_schedule)
+
+
+def _update(workdir: str, name: str, req: ScheduleUpdate) -> dict:
+    with schedule_store.modify(workdir) as schedules:
+        target = next((s for s in schedules if s["name"] == name), None)
+        if not target:
+            raise HTTPException(status_code=404, detail="Schedule not found")
+
+        if req.content is not None:
+            target["content"] = req.content
+        if req.cron is not None:
+            target["cron"] = req.cron
+        if req.enabled is not None:
+            target["enabled"] = req.enabled
+    return target
+
+
+def _remove(workdir: str, name: str):
+    with schedule_store.modify(workdir) as schedules:
+        schedules[:] = [s for s in schedules if s["name"] != name]
+
+
+# 分片读写要拿线程锁、flock 并 fsync，放到线程池里执行，不阻塞事件循环；
+# reload_schedules 操作调度器状态，仍在事件循环上调用
 @router.get("/api/schedules")
-async def list_schedules(uid: str = Depends(get_current_user)):
-    workdir = str(get_user_workdir(uid))
-    return load_schedules(workdir)
+async def list_schedules(user: Principal = Depends(get_current_user)):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, load_schedules, user.workdir)
 
 
 @router.post("/api/schedules")
 async def create_schedule(
-    req: ScheduleCreate, uid: str = Depends(get_current_user)
+    req: ScheduleCreate, user: Principal = Depends(get_current_user)
 ):
-    workdir = str(get_user_workdir(uid))
-    schedules = load_schedules(workdir)
-    if any(s["name"] == req.name for s in schedules):
-        raise HTTPException(status_code=400, detail="Schedule name already exists")
+    workdir = user.workdir
     new_schedule = {
         "name": req.name,
         "content": req.content,
@@ -47,9 +75,9 @@ async def create_schedule(
         "workdir": workdir,
         "enabled": req.enabled,
     }
-    schedules.append(new_schedule)
-    save_schedules(schedules, workdir)
-    reload_schedules()
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, _add, workdir, new_schedule)
+    reload_schedules(workdir)
     return new_schedule
 
 
@@ -57,33 +85,73 @@ async def create_schedule(
 async def update_schedule(
     name: str,
     req: ScheduleUpdate,
-    uid: str = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
 ):
-    workdir = str(get_user_workdir(uid))
-    schedules = load_schedules(workdir)
-    target = next((s for s in schedules if s["name"] == name), None)
-    if not target:
-        raise HTTPException(status_code=404, detail="Schedule not found")
-
-    if req.content is not None:
-        target["content"] = req.content
-    if req.cron is not None:
-        target["cron"] = req.cron
-    if req.enabled is not None:
-        target["enabled"] = req.enabled
-
-    save_schedules(schedules, workdir)
-    reload_schedules()
+    workdir = user.workdir
+    loop = asyncio.get_running_loop()
+    target = await loop.run_in_executor(None, _update, workdir, name, req)
+    reload_schedules(workdir)
     return target
 
 
 @router.delete("/api/schedules/{name}")
 async def delete_schedule(
-    name: str, uid: str = Depends(get_current_user)
+    name: str, user: Principal = Depends(get_current_user)
 ):
-    workdir = str(get_user_workdir(uid))
-    schedules = load_schedules(workdir)
-    schedules = [s for s in schedules if s["name"] != name]
-    save_schedules(schedules, workdir)
-    reload_schedules()
+    workdir = user.workdir
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, _remove, workdir, name)
+    reload_schedules(workdir)
     return {"ok": True}
+
+
+@router.get("/api/schedules/{name}/runs")
+async def list_schedule_runs(name: str, user: Principal = Depends(get_current_user)):
+    workdir = user.workdir
+    return task_logs.list_runs(workdir, name)
+
+
+def _get_own_run(run_id: str, user: Principal) -> dict:
+    rec = task_logs.get_run(run_id)
+    if not rec or rec["workdir"] != user.workdir:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return rec
+
+
+@router.get("/api/schedules/runs/{run_id}/log")
+async def get_run_log(
+    run_id: str,
+    offset: int = Query(0, ge=0),
+    length: int = Query(65536, ge=1, le=4 * 1024 * 1024),
+    user: Principal = Depends(get_current_user),
+):
+    """Return a byte range of a run's output without loading the whole log."""
+    rec = _get_own_run(run_id, user)
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(None, task_logs.read_range, rec, offset, length)
+    return Response(
+        content=data,
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "X-Log-Size": str(rec["bytes"]),
+            "X-Next-Offset": str(offset + len(data)),
+        },
+    )
+
+
+@router.get("/api/schedules/runs/{run_id}/tail")
+async def tail_run_log(
+    run_id: str,
+    offset: Optional[int] = Query(None, ge=0),
+    user: Principal = Depends(get_current_user),
+):
+    """Stream a run's output as it is written; ends when the run finishes.
+
+    Starts from offset, or from the last 64 KiB when omitted.
+    """
+    rec = _get_own_run(run_id, user)
+    if offset is None:
+        offset = max(0, rec["bytes"] - 65536)
+    return StreamingResponse(
+        task_logs.follow(rec, offset), media_type="text/plain; charset=utf-8"
+    )
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends, Query
+
+from ..deps import Principal, get_current_user
+from ..services import search_index
+
+router = APIRouter()
+
+
+@router.get("/api/search")
+async def search_transcripts(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=200),
+    user: Principal = Depends(get_current_user),
+):
+    """Full-text search over session transcripts, best matches first.
+
+    Each hit's offset / index can be passed to the transcript endpoint.
+    """
+    return await search_index.search_async(q, user.uid, limit)
@@ -1,26 +1,40 @@
+import asyncio
+import json
 import uuid
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 
-from ..deps import get_current_user
-from ..config import get_user_workdir
-from ..services import tmux, claude_session
+from ..deps import Principal, get_current_user, get_current_user_ws
+from ..services import (
+    tmux, claude_session, status_monitor, pane_snapshot, session_pool, session_reaper,
+)
 
 router = APIRouter()
 
 
+class PreviewRequest(BaseModel):
+    session_ids: list[str]
+    lines: int = 12
+
+
 @router.get("/api/sessions")
-async def list_sessions(uid: str = Depends(get_current_user)):
-    discovered = claude_session.discover_sessions(uid)
-    alive_sessions = await tmux.list_tmux_sessions()
+async def list_sessions(user: Principal = Depends(get_current_user)):
+    # 打开首页的用户很可能马上新建会话，提前预热
+    session_pool.note_active(user.uid, user.workdir)
+    discovered = await claude_session.discover_sessions_async(user.uid)
+    statuses = status_monitor.snapshot()
 
     results = []
     for s in discovered:
         sid = s["session_id"]
-        alive = sid in alive_sessions
-        status = None
-        if alive:
-            status = await tmux.detect_status(sid)
+        alive = sid in statuses
+        status = statuses.get(sid)
+        if not alive and session_reaper.is_evicted(sid):
+            # 被回收的会话打开时会自动恢复
+            status = "evicted"
         results.append(
             {
                 "session_id": sid,
@@ -35,37 +49,134 @@ async def list_sessions(uid: str = Depends(get_current_user)):
 
 
 @router.post("/api/sessions")
-async def create_session(uid: str = Depends(get_current_user)):
-    session_id = str(uuid.uuid4())
-    workdir = str(get_user_workdir(uid))
-    ok = await tmux.create_session(session_id, workdir)
-    if not ok:
-        raise HTTPException(status_code=500, detail="Failed to create tmux session")
+async def create_session(user: Principal = Depends(get_current_user)):
+    session_id = await session_pool.acquire(user.uid, user.workdir)
+    if session_id is None:
+        session_id = str(uuid.uuid4())
+        ok = await tmux.create_session(session_id, user.workdir)
+        if not ok:
+            raise HTTPException(status_code=500, detail="Failed to create tmux session")
+    status_monitor.mark(session_id, "idle", user.uid)
     return {"session_id": session_id}
 
 
 @router.post("/api/sessions/{session_id}/resume")
-async def resume_session(session_id: str, uid: str = Depends(get_current_user)):
+async def resume_session(session_id: str, user: Principal = Depends(get_current_user)):
     if await tmux.session_exists(session_id):
         raise HTTPException(status_code=400, detail="Session already alive")
-    workdir = str(get_user_workdir(uid))
-    ok = await tmux.resume_session(session_id, workdir)
+    ok = await session_reaper.ensure_alive(user.uid, session_id, user.workdir, allow_dead=True)
     if not ok:
         raise HTTPException(status_code=500, detail="Failed to resume session")
     return {"session_id": session_id}
 
 
 @router.delete("/api/sessions/{session_id}")
-async def close_session(session_id: str, uid: str = Depends(get_current_user)):
+async def close_session(session_id: str, user: Principal = Depends(get_current_user)):
     if not await tmux.session_exists(session_id):
         raise HTTPException(status_code=404, detail="Session not found or already dead")
     await tmux.kill_session(session_id)
+    status_monitor.mark(session_id, None)
     return {"ok": True}
 
 
 @router.delete("/api/sessions/{session_id}/delete")
-async def delete_session(session_id: str, uid: str = Depends(get_current_user)):
+async def delete_session(session_id: str, user: Principal = Depends(get_current_user)):
     if await tmux.session_exists(session_id):
         await tmux.kill_session(session_id)
-    claude_session.delete_session(uid, session_id)
+        status_monitor.mark(session_id, None)
+    session_reaper.forget(session_id)
+    claude_session.delete_session(user.uid, session_id)
     return {"ok": True}
+
+
+def _csv(value: Optional[str]) -> Optional[set[str]]:
+    if not value:
+        return None
+    return {v.strip() for v in value.split(",") if v.strip()} or None
+
+
+@router.get("/api/sessions/{session_id}/transcript")
+async def get_transcript(
+    session_id: str,
+    offset: int = Query(0, ge=0),
+    index: Optional[int] = Query(None, ge=0, description="Start at this message number"),
+    limit: int = Query(100, ge=1, le=1000),
+    role: Optional[str] = Query(None, description="Comma-separated message roles"),
+    type: Optional[str] = Query(None, description="Comma-separated entry types"),
+    tool: Optional[str] = Query(None, description="Comma-separated tool_use names"),
+    user: Principal = Depends(get_current_user),
+):
+    """Page through a session transcript as NDJSON.
+
+    The last line carries next_offset / next_index for the following page.
+    """
+    path = claude_session.transcript_path(user.uid, session_id)
+    if path is None or not path.is_file():
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    entries = claude_session.read_transcript(
+        path, offset, index, limit, _csv(role), _csv(type), _csv(tool)
+    )
+    lines = (json.dumps(e, ensure_ascii=False) + "\n" for e in entries)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+
+@router.get("/api/sessions/{session_id}/snapshot")
+async def get_snapshot(
+    session_id: str,
+    scrollback: int = Query(0, ge=0, le=10000),
+    escapes: bool = True,
+    user: Principal = Depends(get_current_user),
+):
+    """Current screen (plus scrollback lines) of a live session, for instant painting."""
+    snaps = await pane_snapshot.snapshots([session_id], scrollback, escapes)
+    if session_id not in snaps:
+        raise HTTPException(status_code=404, detail="Session not found or not alive")
+    return snaps[session_id]
+
+
+@router.post("/api/sessions/previews")
+async def get_previews(req: PreviewRequest, user: Principal = Depends(get_current_user)):
+    """Last lines of text on screen for many sessions at once: {session_id: text}."""
+    if len(req.session_ids) > 500:
+        raise HTTPException(status_code=400, detail="Too many sessions")
+    snaps = await pane_snapshot.snapshots(req.session_ids)
+    lines = max(1, min(req.lines, 100))
+    return {
+        sid: "\n".join(snap["content"].rstrip().splitlines()[-lines:])
+        for sid, snap in snaps.items()
+    }
+
+
+@router.websocket("/api/ws/status")
+async def status_ws(websocket: WebSocket, user: Principal = Depends(get_current_user_ws)):
+    """Push the status snapshot once, then only the sessions whose status changed.
+
+    Only the caller's own sessions are sent; admins get every session.
+    """
+    await websocket.accept()
+    queue = status_monitor.subscribe(None if user.admin else user.uid)
+
+    async def drain_client():
+        # 客户端不发送数据，只用来感知断开
+        while True:
+            msg = await websocket.receive()
+            if msg.get("type") == "websocket.disconnect":
+                return
+
+    disconnect = asyncio.create_task(drain_client())
+    try:
+        while not disconnect.done():
+            getter = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait(
+                {getter, disconnect}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter not in done:
+                getter.cancel()
+                break
+            await websocket.send_json(getter.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        status_monitor.unsubscribe(queue)
+        disconnect.cancel()
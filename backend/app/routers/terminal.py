@@ -1,18 +1,11 @@
 import asyncio
-import fcntl
 import json
 import logging
-import os
-import pty
-import signal
-import struct
-import subprocess
-import termios
 
 from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
 
-from ..deps import get_current_user_ws
-from ..services import tmux
+from ..deps import Principal, get_current_user_ws
+from ..services import session_reaper, status_monitor, terminal_hub
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -22,48 +15,39 @@ router = APIRouter()
 async def terminal_ws(
     websocket: WebSocket,
     session_id: str,
-    uid: str = Depends(get_current_user_ws),
+    readonly: bool = False,
+    user: Principal = Depends(get_current_user_ws),
 ):
     await websocket.accept()
 
-    if not await tmux.session_exists(session_id):
+    # 被回收的会话在打开时直接恢复；用户自己结束的会话需显式 resume
+    alive = await session_reaper.ensure_alive(user.uid, session_id, user.workdir)
+    if alive and status_monitor.owner(session_id) is None:
+        # 刚由外部启动、尚未轮询到的会话，先刷新一次以得知归属
+        await status_monitor.refresh()
+    if not alive or not (user.admin or status_monitor.owner(session_id) == user.uid):
         await websocket.send_text(
             json.dumps({"error": "Session not found or not alive"})
         )
         await websocket.close()
         return
 
-    # Spawn pty attached to tmux session
-    env = os.environ.copy()
-    env["TERM"] = "xterm-256color"
+    # Attach to (or share) the tmux client for this session
     try:
-        master_fd, slave_fd = pty.openpty()
-        # 设置初始窗口大小
-        fcntl.ioctl(slave_fd, termios.TIOCSWINSZ, struct.pack("HHHH", 24, 80, 0, 0))
-        proc = subprocess.Popen(
-            ["tmux", "attach-session", "-t", session_id],
-            stdin=slave_fd, stdout=slave_fd, stderr=slave_fd,
-            env=env, preexec_fn=os.setsid,
-        )
-        os.close(slave_fd)
+        sub = terminal_hub.join(session_id, readonly)
     except Exception as e:
         logger.error(f"Failed to spawn pty: {e}")
         await websocket.send_text(json.dumps({"error": str(e)}))
         await websocket.close()
         return
 
+    session_reaper.touch(session_id)
     closed = asyncio.Event()
 
     async def pty_reader():
-        loop = asyncio.get_event_loop()
         try:
             while not closed.is_set():
-                try:
-                    data = await loop.run_in_executor(
-                        None, lambda: os.read(master_fd, 4096)
-                    )
-                except OSError:
-                    break
+                data = await sub.get()
                 if not data:
                     break
                 try:
@@ -83,20 +67,17 @@ async def terminal_ws(
             if msg.get("type") == "websocket.disconnect":
                 break
             if "bytes" in msg:
-                os.write(master_fd, msg["bytes"])
+                sub.write(msg["bytes"])
             elif "text" in msg:
                 text = msg["text"]
                 try:
                     cmd = json.loads(text)
                     if isinstance(cmd, dict) and cmd.get("type") == "resize":
-                        rows, cols = cmd["rows"], cmd["cols"]
-                        fcntl.ioctl(master_fd, termios.TIOCSWINSZ,
-                                    struct.pack("HHHH", rows, cols, 0, 0))
-                        os.kill(proc.pid, signal.SIGWINCH)
+                        sub.resize(cmd["rows"], cmd["cols"])
                         continue
                 except (json.JSONDecodeError, KeyError):
                     pass
-                os.write(master_fd, text.encode())
+                sub.write(text.encode())
     except WebSocketDisconnect:
         pass
     except Exception as e:
@@ -104,18 +85,5 @@ async def terminal_ws(
     finally:
         closed.set()
         reader_task.cancel()
-        # Detach from tmux instead of killing
-        try:
-            os.write(master_fd, b"\x02d")
-            await asyncio.sleep(0.3)
-        except OSError:
-            pass
-        try:
-            os.close(master_fd)
-        except OSError:
-            pass
-        try:
-            proc.send_signal(signal.SIGHUP)
-            proc.wait(timeout=2)
-        except Exception:
-            proc.kill()
+        await terminal_hub.leave(sub)
+        session_reaper.touch(session_id)
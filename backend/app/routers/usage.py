@@ -0,0 +1,20 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+
+from ..deps import Principal, get_current_user
+from ..services import usage
+
+router = APIRouter()
+
+
+@router.get("/api/usage")
+async def my_usage(
+    group: str = Query("session", pattern="^(session|schedule|model|day|hour)$"),
+    since: Optional[str] = Query(None, description="ISO time, e.g. 2026-10-01"),
+    until: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    user: Principal = Depends(get_current_user),
+):
+    """The caller's own token and cost rollups."""
+    return await usage.rollup_async(group, [user.uid], since, until, limit)
@@ -1,93 +1,344 @@
+import asyncio
+import bisect
 import json
+import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Iterator, Optional
 
-from ..config import get_claude_project_dir
+from ..config import DISCOVERY_WORKERS, TRANSCRIPT_MAX_LINE_BYTES, get_claude_project_dir
+from . import fs_watcher, metrics
 
 UUID_RE = re.compile(
     r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.IGNORECASE
 )
 
+# 每隔多少条消息记录一次字节偏移，按消息序号翻页时从最近的检查点开始读
+CHECKPOINT_EVERY = 1000
 
-def _is_real_session(filepath: Path) -> bool:
-    """Check if a .jsonl file is a real session by looking for 'sessionId' keyword."""
+
+@dataclass
+class _IndexEntry:
+    """Parsed summary of one <uuid>.jsonl, valid for the (inode, size, mtime) it was read at."""
+
+    inode: int
+    size: int
+    mtime_ns: int
+    offset: int = 0  # end of the last complete line that has been parsed
+    is_real: bool = False
+    first_message: str = ""
+    updated_at: str = ""
+    lines: int = 0  # complete non-blank lines (messages) before offset
+    checkpoints: list[int] = field(default_factory=list)  # offset of message k*CHECKPOINT_EVERY
+
+
+# project dir -> {session_id: entry}
+_index: dict[Path, dict[str, _IndexEntry]] = {}
+_index_lock = threading.Lock()
+# 每个项目目录一把锁，不同用户的扫描可以在线程池中并行
+_project_locks: dict[Path, threading.Lock] = {}
+# 文件监听生效时：已完整扫描过的项目目录，以及其后有变动、待刷新的会话
+_fresh: set[Path] = set()
+_dirty: dict[Path, set[str]] = {}
+
+_discovery_pool = ThreadPoolExecutor(
+    max_workers=DISCOVERY_WORKERS, thread_name_prefix="discover"
+)
+
+
+def _project_lock(project_dir: Path) -> threading.Lock:
+    with _index_lock:
+        return _project_locks.setdefault(project_dir, threading.Lock())
+
+
+def _line_timestamp(raw: bytes) -> str:
     try:
-        with open(filepath, "r", encoding="utf-8", errors="replace") as f:
-            for line in f:
-                if '"sessionId"' in line:
-                    return True
-        return False
-    except OSError:
-        return False
+        obj = json.loads(raw)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return ""
+    return obj.get("timestamp", "") if isinstance(obj, dict) else ""
 
 
-def _get_first_message(filepath: Path) -> str:
-    """Extract the content of the first user message from a .jsonl file."""
+def _line_first_message(raw: bytes) -> str:
     try:
-        with open(filepath, "r", encoding="utf-8", errors="replace") as f:
-            for line in f:
-                try:
-                    obj = json.loads(line)
-                    msg = obj.get("message")
-                    if isinstance(msg, dict) and msg.get("content"):
-                        return msg["content"][:100]
-                except (json.JSONDecodeError, KeyError):
-                    continue
-    except OSError:
+        obj = json.loads(raw)
+        msg = obj.get("message")
+        if isinstance(msg, dict) and msg.get("content"):
+            return msg["content"][:100]
+    except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
         pass
     return ""
 
 
-def _get_last_timestamp(filepath: Path) -> str:
-    """Get the timestamp from the last line of a .jsonl file."""
+def _refresh_entry(filepath: Path, st: os.stat_result, entry: _IndexEntry | None) -> _IndexEntry:
+    """Bring an index entry up to date, parsing only the bytes appended since the last read."""
+    if entry is not None and entry.inode == st.st_ino:
+        if entry.size == st.st_size and entry.mtime_ns == st.st_mtime_ns:
+            return entry
+        if st.st_size < entry.offset:
+            # 文件被截断或重写，从头解析
+            entry = None
+    if entry is None or entry.inode != st.st_ino:
+        entry = _IndexEntry(inode=st.st_ino, size=0, mtime_ns=0)
+
+    start_offset = entry.offset
+    last_line = b""
     try:
         with open(filepath, "rb") as f:
-            # 从文件末尾往前读取最后一行
-            f.seek(0, 2)
-            size = f.tell()
-            if size == 0:
-                return ""
-            pos = size - 1
-            while pos > 0:
-                f.seek(pos)
-                if f.read(1) == b"\n" and pos < size - 1:
+            f.seek(entry.offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    # 末尾未写完的行：只用来取时间戳，下次从这里继续
+                    ts = _line_timestamp(raw)
+                    if ts:
+                        last_line = raw
                     break
-                pos -= 1
-            last_line = f.read().decode("utf-8", errors="replace").strip()
-            if last_line:
-                obj = json.loads(last_line)
-                return obj.get("timestamp", "")
-    except (OSError, json.JSONDecodeError):
-        pass
-    return ""
+                entry.offset += len(raw)
+                if not raw.strip():
+                    continue
+                if entry.lines % CHECKPOINT_EVERY == 0:
+                    entry.checkpoints.append(entry.offset - len(raw))
+                entry.lines += 1
+                last_line = raw
+                if not entry.is_real and b'"sessionId"' in raw:
+                    entry.is_real = True
+                if not entry.first_message:
+                    entry.first_message = _line_first_message(raw)
+    except OSError:
+        return entry
+
+    metrics.inc("claudecohub_discovery_files_scanned_total")
+    metrics.inc("claudecohub_discovery_bytes_read_total", entry.offset - start_offset)
+    if last_line:
+        entry.updated_at = _line_timestamp(last_line)
+    entry.size = st.st_size
+    entry.mtime_ns = st.st_mtime_ns
+    return entry
+
+
+def apply_changes(changes: list[fs_watcher.Change]):
+    """fs_watcher subscriber: mark the sessions and project dirs that changed."""
+    with _index_lock:
+        for change in changes:
+            if change.kind == "rescan":
+                _fresh.clear()
+                _dirty.clear()
+            elif change.path.suffix == ".jsonl":
+                _dirty.setdefault(change.path.parent, set()).add(change.path.stem)
+            else:
+                _fresh.discard(change.path)
+                _dirty.pop(change.path, None)
+
+
+def _refresh_dirty(project_dir: Path, entries: dict[str, _IndexEntry], dirty: set[str]):
+    for sid in dirty:
+        if not UUID_RE.match(sid):
+            continue
+        filepath = project_dir / f"{sid}.jsonl"
+        try:
+            st = filepath.stat()
+        except OSError:
+            entries.pop(sid, None)
+            continue
+        entries[sid] = _refresh_entry(filepath, st, entries.get(sid))
+
+
+def _refresh_project(project_dir: Path) -> dict[str, _IndexEntry]:
+    with _project_lock(project_dir):
+        entries = _index.setdefault(project_dir, {})
+        if fs_watcher.active():
+            with _index_lock:
+                fresh = project_dir in _fresh
+                dirty = _dirty.pop(project_dir, set())
+                # 扫描前就标记，扫描期间到达的变动会留到下一次
+                _fresh.add(project_dir)
+            if fresh:
+                # 目录未变，只读有事件的文件，空闲时零磁盘 I/O
+                _refresh_dirty(project_dir, entries, dirty)
+                return dict(entries)
+        seen = set()
+        try:
+            dir_iter = list(os.scandir(project_dir))
+        except OSError:
+            _index.pop(project_dir, None)
+            return {}
+        for de in dir_iter:
+            name = de.name
+            if not name.endswith(".jsonl"):
+                continue
+            sid = name[:-6]
+            if not UUID_RE.match(sid):
+                continue
+            try:
+                st = de.stat()
+            except OSError:
+                continue
+            seen.add(sid)
+            entries[sid] = _refresh_entry(Path(de.path), st, entries.get(sid))
+        for sid in list(entries):
+            if sid not in seen:
+                del entries[sid]
+        return dict(entries)
 
 
 def discover_sessions(username: str) -> list[dict]:
     """Scan Claude project dir for UUID-named .jsonl files that are real sessions."""
     project_dir = get_claude_project_dir(username)
-    if not project_dir.exists():
-        return []
-
-    sessions = []
-    for f in project_dir.iterdir():
-        if f.suffix == ".jsonl" and UUID_RE.match(f.stem) and _is_real_session(f):
-            sessions.append(
-                {
-                    "session_id": f.stem,
-                    "updated_at": _get_last_timestamp(f),
-                    "first_message": _get_first_message(f),
-                }
-            )
+    sessions = [
+        {
+            "session_id": sid,
+            "updated_at": e.updated_at,
+            "first_message": e.first_message,
+        }
+        for sid, e in _refresh_project(project_dir).items()
+        if e.is_real
+    ]
 
     sessions.sort(key=lambda s: s["updated_at"], reverse=True)
     return sessions
 
 
+async def discover_sessions_async(username: str) -> list[dict]:
+    """discover_sessions on the bounded discovery pool, off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_discovery_pool, discover_sessions, username)
+
+
 def delete_session(username: str, session_id: str) -> bool:
     """Delete the .jsonl file for a session."""
     project_dir = get_claude_project_dir(username)
     filepath = project_dir / f"{session_id}.jsonl"
+    with _project_lock(project_dir):
+        _index.get(project_dir, {}).pop(session_id, None)
     if filepath.exists():
         filepath.unlink()
         return True
     return False
+
+
+def transcript_path(username: str, session_id: str) -> Optional[Path]:
+    """Path of a session's transcript, or None if the id is not a session uuid."""
+    if not UUID_RE.match(session_id):
+        return None
+    return get_claude_project_dir(username) / f"{session_id}.jsonl"
+
+
+def _checkpoints(filepath: Path) -> list[int]:
+    project_dir = filepath.parent
+    sid = filepath.name[:-6]
+    with _project_lock(project_dir):
+        entries = _index.setdefault(project_dir, {})
+        entry = _refresh_entry(filepath, filepath.stat(), entries.get(sid))
+        entries[sid] = entry
+        return list(entry.checkpoints)
+
+
+def read_line(f, limit: int) -> tuple[bytes, int, bool]:
+    """Read one line keeping at most `limit` bytes of it in memory.
+
+    Returns (head, total length, ended with newline); head is shorter than
+    the line when the line exceeds limit.
+    """
+    head = f.readline(limit)
+    n = len(head)
+    if n < limit or head.endswith(b"\n"):
+        return head, n, head.endswith(b"\n")
+    while True:
+        chunk = f.readline(limit)
+        n += len(chunk)
+        if not chunk or chunk.endswith(b"\n"):
+            return head, n, chunk.endswith(b"\n")
+
+
+def _entry_matches(obj: dict, roles, types, tools) -> bool:
+    if types and obj.get("type") not in types:
+        return False
+    msg = obj.get("message")
+    msg = msg if isinstance(msg, dict) else {}
+    if roles and msg.get("role") not in roles:
+        return False
+    if tools:
+        content = msg.get("content")
+        if not isinstance(content, list):
+            return False
+        return any(
+            isinstance(c, dict) and c.get("type") == "tool_use" and c.get("name") in tools
+            for c in content
+        )
+    return True
+
+
+def read_transcript(
+    filepath: Path,
+    offset: int = 0,
+    index: Optional[int] = None,
+    limit: int = 100,
+    roles: Optional[set[str]] = None,
+    types: Optional[set[str]] = None,
+    tools: Optional[set[str]] = None,
+) -> Iterator[dict]:
+    """Stream transcript entries, one parsed line at a time, in constant memory.
+
+    Starts at message number `index` when given, otherwise at the first line
+    at or after byte `offset`; seeking starts from the nearest checkpoint kept
+    by the session index. Yields {"offset", "index", "entry"} for up to
+    `limit` entries matching the filters, then a final
+    {"next_offset", "next_index", "eof"} to resume from. Lines longer than
+    TRANSCRIPT_MAX_LINE_BYTES are not parsed; without filters they are
+    reported as {"offset", "index", "size", "truncated": true}.
+    """
+    checkpoints = _checkpoints(filepath)
+    if index is not None:
+        k = min(index // CHECKPOINT_EVERY, len(checkpoints) - 1)
+    else:
+        k = bisect.bisect_right(checkpoints, offset) - 1
+    pos = checkpoints[k] if k >= 0 else 0
+    idx = max(k, 0) * CHECKPOINT_EVERY
+
+    # 需要的值至少要以 JSON 字符串形式出现在行内，先做字节级预筛选
+    needles = [
+        [json.dumps(v, ensure_ascii=False).encode() for v in values]
+        for values in (roles, types, tools) if values
+    ]
+    filtered = bool(needles)
+
+    matched = 0
+    eof = False
+    with open(filepath, "rb") as f:
+        f.seek(pos)
+        while True:
+            line_start = pos
+            head, n, complete = read_line(f, TRANSCRIPT_MAX_LINE_BYTES)
+            if not complete:
+                # 文件末尾或尚未写完的行，下次从行首继续
+                pos = line_start
+                eof = True
+                break
+            pos += n
+            if not head.strip():
+                continue
+            i = idx
+            idx += 1
+            if (index is not None and i < index) or (index is None and line_start < offset):
+                continue
+            if n > len(head):
+                if filtered:
+                    continue
+                yield {"offset": line_start, "index": i, "size": n, "truncated": True}
+            else:
+                if any(not any(nd in head for nd in group) for group in needles):
+                    continue
+                try:
+                    obj = json.loads(head)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                if not isinstance(obj, dict) or not _entry_matches(obj, roles, types, tools):
+                    continue
+                yield {"offset": line_start, "index": i, "entry": obj}
+            matched += 1
+            if matched >= limit:
+                break
+    yield {"next_offset": pos, "next_index": idx, "eof": eof}
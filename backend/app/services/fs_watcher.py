@@ -0,0 +1,297 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from ..config import (
+    CLAUDE_PROJECTS_DIR,
+    WORKDIR_BASE,
+    WATCH_DEBOUNCE,
+    WATCH_POLL_INTERVAL,
+    WATCH_USE_INOTIFY,
+    encode_path_for_claude,
+)
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct("iIII")
+_DIR_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+_PROJECT_MASK = _DIR_MASK | IN_MODIFY
+
+
+@dataclass(frozen=True)
+class Change:
+    """One coalesced filesystem change.
+
+    kind is "created", "modified" or "deleted"; path is a transcript file or
+    a project / user directory. kind "rescan" with path=None means events were
+    lost and subscribers should drop whatever they cached.
+    """
+
+    kind: str
+    path: Optional[Path]
+
+
+_subscribers: list[Callable[[list[Change]], None]] = []
+_pending: dict[Optional[Path], str] = {}
+_flush_handle: Optional[asyncio.TimerHandle] = None
+_backend: Optional["_Inotify | _Poller"] = None
+
+
+def subscribe(callback: Callable[[list[Change]], None]):
+    """Call callback(changes) on the event loop after each debounced batch."""
+    _subscribers.append(callback)
+
+
+def active() -> bool:
+    """True while changes are being tracked, so a cached catalogue can be trusted."""
+    return _backend is not None
+
+
+def backend() -> Optional[str]:
+    return _backend.name if _backend is not None else None
+
+
+def _emit(kind: str, path: Optional[Path]):
+    global _flush_handle
+    prev = _pending.get(path)
+    # 同一路径在窗口内先建后改仍算 created，删除则以最后一次为准
+    if not (prev == "created" and kind == "modified"):
+        _pending[path] = kind
+    if _flush_handle is None:
+        _flush_handle = asyncio.get_running_loop().call_later(WATCH_DEBOUNCE, _flush)
+
+
+def _flush():
+    global _flush_handle
+    _flush_handle = None
+    if None in _pending:
+        changes = [Change("rescan", None)]
+    else:
+        changes = [Change(kind, path) for path, kind in _pending.items()]
+    _pending.clear()
+    for callback in list(_subscribers):
+        try:
+            callback(changes)
+        except Exception as e:
+            logger.warning(f"fs change subscriber failed: {e}")
+
+
+def _is_transcript(name: str) -> bool:
+    return name.endswith(".jsonl")
+
+
+class _Inotify:
+    """inotify via libc: one watch per root and per project directory."""
+
+    name = "inotify"
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._wds: dict[int, Path] = {}
+
+    def _watch(self, path: Path, mask: int) -> bool:
+        wd = self._add_watch(self.fd, os.fsencode(path), mask | IN_ONLYDIR)
+        if wd < 0:
+            return False
+        self._wds[wd] = path
+        return True
+
+    def _watch_project(self, path: Path, announce: bool):
+        if not self._watch(path, _PROJECT_MASK):
+            return
+        if announce:
+            # 目录创建与加 watch 之间写入的文件不会有事件，补报一次
+            _emit("created", path)
+            try:
+                for de in os.scandir(path):
+                    if _is_transcript(de.name):
+                        _emit("created", Path(de.path))
+            except OSError:
+                pass
+
+    def start(self):
+        for root in (CLAUDE_PROJECTS_DIR, WORKDIR_BASE):
+            root.mkdir(parents=True, exist_ok=True)
+            if not self._watch(root, _DIR_MASK):
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {root}")
+        for de in os.scandir(CLAUDE_PROJECTS_DIR):
+            if de.is_dir():
+                self._watch_project(Path(de.path), announce=False)
+        asyncio.get_running_loop().add_reader(self.fd, self._on_readable)
+
+    def _on_readable(self):
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        pos = 0
+        while pos + _EVENT.size <= len(buf):
+            wd, mask, _cookie, length = _EVENT.unpack_from(buf, pos)
+            name = buf[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b"\0")
+            pos += _EVENT.size + length
+            self._handle(wd, mask, os.fsdecode(name))
+
+    def _handle(self, wd: int, mask: int, name: str):
+        if mask & IN_Q_OVERFLOW:
+            logger.warning("inotify queue overflowed, subscribers will rescan")
+            _emit("rescan", None)
+            return
+        base = self._wds.get(wd)
+        if base is None:
+            return
+        if mask & IN_IGNORED:
+            # 目录已删除，内核自动移除了 watch
+            del self._wds[wd]
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            return
+        path = base / name
+        is_dir = bool(mask & IN_ISDIR)
+        if base == CLAUDE_PROJECTS_DIR:
+            if not is_dir:
+                return
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_project(path, announce=True)
+            else:
+                _emit("deleted", path)
+        elif base == WORKDIR_BASE:
+            if is_dir:
+                _emit("deleted" if mask & (IN_DELETE | IN_MOVED_FROM) else "created", path)
+        elif _is_transcript(name) and not is_dir:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                _emit("created", path)
+            elif mask & IN_MODIFY:
+                _emit("modified", path)
+            else:
+                _emit("deleted", path)
+
+    def stop(self):
+        try:
+            asyncio.get_running_loop().remove_reader(self.fd)
+        except RuntimeError:
+            pass
+        os.close(self.fd)
+
+
+class _Poller:
+    """Fallback when inotify is unavailable: stat-scan the trees on an interval."""
+
+    name = "poll"
+
+    def __init__(self):
+        self._state: dict[Path, tuple[int, int, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _scan() -> dict[Path, tuple[int, int, int]]:
+        state = {}
+        for root, nested in ((WORKDIR_BASE, False), (CLAUDE_PROJECTS_DIR, True)):
+            try:
+                dirs = [de for de in os.scandir(root) if de.is_dir()]
+            except OSError:
+                continue
+            for d in dirs:
+                state[Path(d.path)] = (0, 0, 0)
+                if not nested:
+                    continue
+                try:
+                    for de in os.scandir(d.path):
+                        if _is_transcript(de.name):
+                            st = de.stat()
+                            state[Path(de.path)] = (st.st_ino, st.st_size, st.st_mtime_ns)
+                except OSError:
+                    continue
+        return state
+
+    def _diff(self, state: dict[Path, tuple[int, int, int]]):
+        for path, sig in state.items():
+            old = self._state.get(path)
+            if old is None:
+                _emit("created", path)
+            elif old != sig:
+                _emit("modified", path)
+        for path in self._state.keys() - state.keys():
+            _emit("deleted", path)
+        self._state = state
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(WATCH_POLL_INTERVAL)
+            try:
+                self._diff(await loop.run_in_executor(None, self._scan))
+            except Exception as e:
+                logger.warning(f"fs poll failed: {e}")
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._state = await loop.run_in_executor(None, self._scan)
+        self._task = asyncio.create_task(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+
+def username_for(project_dir: Path) -> Optional[str]:
+    """Map a Claude project directory back to the user whose workdir it encodes."""
+    prefix = encode_path_for_claude(WORKDIR_BASE) + "-"
+    name = project_dir.name
+    if not name.startswith(prefix):
+        return None
+    return name[len(prefix):] or None
+
+
+async def start():
+    global _backend
+    if WATCH_USE_INOTIFY:
+        watcher = None
+        try:
+            watcher = _Inotify()
+            watcher.start()
+            _backend = watcher
+            logger.info("Watching session files with inotify")
+            return
+        except (OSError, AttributeError) as e:
+            if watcher is not None:
+                os.close(watcher.fd)
+            logger.info(f"inotify unavailable, polling every {WATCH_POLL_INTERVAL}s: {e}")
+    poller = _Poller()
+    await poller.start()
+    _backend = poller
+
+
+async def stop():
+    global _backend, _flush_handle
+    if _backend is not None:
+        _backend.stop()
+        _backend = None
+    if _flush_handle is not None:
+        _flush_handle.cancel()
+        _flush_handle = None
+    _pending.clear()
@@ -0,0 +1,174 @@
+import asyncio
+import bisect
+import threading
+import time
+from typing import Iterable, Optional
+
+from ..config import METRICS_ENABLED
+
+# 直方图桶上限（秒），覆盖从毫秒级请求到半小时的任务
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+            1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+
+# name -> (type, help)；所有指标在此登记，便于一处查阅
+_METRICS = {
+    "claudecohub_http_request_duration_seconds":
+        ("histogram", "HTTP request latency by route template, method and status class."),
+    "claudecohub_discovery_files_scanned_total":
+        ("counter", "Transcript files read by session discovery."),
+    "claudecohub_discovery_bytes_read_total":
+        ("counter", "Transcript bytes parsed by session discovery."),
+    "claudecohub_pty_bytes_total":
+        ("counter", "Bytes read from shared terminal PTYs."),
+    "claudecohub_pty_frames_total":
+        ("counter", "Frames fanned out by shared terminals."),
+    "claudecohub_task_duration_seconds":
+        ("histogram", "Scheduled task run time by result."),
+    "claudecohub_task_wait_seconds":
+        ("histogram", "Time scheduled tasks waited in the queue after becoming ready."),
+    "claudecohub_sessions_evicted_total":
+        ("counter", "Idle sessions stopped by the reaper, by reason."),
+    "claudecohub_sessions_resumed_total":
+        ("counter", "Evicted or dead sessions resumed on open."),
+    "claudecohub_status_hook_events_total":
+        ("counter", "Session state events received from Claude Code hooks, by event."),
+    "claudecohub_event_loop_lag_seconds":
+        ("histogram", "Extra delay of a periodic event-loop timer, sampled every 0.5 s."),
+}
+
+_lock = threading.Lock()
+_counters: dict[str, dict[tuple, float]] = {}
+# name -> labels -> [bucket counts..., +Inf count, sum]
+_histograms: dict[str, dict[tuple, list[float]]] = {}
+_lag_task: Optional[asyncio.Task] = None
+
+
+def inc(name: str, value: float = 1.0, **labels: str):
+    if not METRICS_ENABLED:
+        return
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0.0) + value
+
+
+def observe(name: str, value: float, **labels: str):
+    if not METRICS_ENABLED:
+        return
+    key = tuple(sorted(labels.items()))
+    i = bisect.bisect_left(_BUCKETS, value)
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        buckets = series.get(key)
+        if buckets is None:
+            buckets = series[key] = [0.0] * (len(_BUCKETS) + 2)
+        buckets[i] += 1
+        buckets[-1] += value
+
+
+def _fmt_labels(labels: Iterable[tuple[str, str]], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(str(v))}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(samples: Iterable[tuple[str, str, str, dict, float]] = ()) -> str:
+    """Prometheus text exposition of the recorded series plus scrape-time samples.
+
+    samples are (name, type, help, labels, value), read from other services'
+    own stats at scrape time; consecutive samples of one name share a header.
+    """
+    lines: list[str] = []
+    with _lock:
+        counters = {n: dict(s) for n, s in _counters.items()}
+        histograms = {n: {k: list(v) for k, v in s.items()} for n, s in _histograms.items()}
+
+    for name, (kind, help_text) in _METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for key, value in counters.get(name, {}).items():
+                lines.append(f"{name}{_fmt_labels(key)} {value:g}")
+            continue
+        for key, buckets in histograms.get(name, {}).items():
+            cumulative = 0.0
+            for bound, count in zip(_BUCKETS, buckets):
+                cumulative += count
+                le = _fmt_labels(key, f'le="{bound:g}"')
+                lines.append(f"{name}_bucket{le} {cumulative:g}")
+            cumulative += buckets[len(_BUCKETS)]
+            le = _fmt_labels(key, 'le="+Inf"')
+            lines.append(f"{name}_bucket{le} {cumulative:g}")
+            lines.append(f"{name}_sum{_fmt_labels(key)} {buckets[-1]:.6f}")
+            lines.append(f"{name}_count{_fmt_labels(key)} {cumulative:g}")
+
+    last = None
+    for name, kind, help_text, labels, value in samples:
+        if name != last:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            last = name
+        lines.append(f"{name}{_fmt_labels(sorted(labels.items()))} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+class RequestTimer:
+    """ASGI middleware recording HTTP latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            observe(
+                "claudecohub_http_request_duration_seconds",
+                time.perf_counter() - start,
+                route=getattr(route, "path", "static"),
+                method=scope["method"],
+                status=f"{status // 100}xx",
+            )
+
+
+async def _lag_loop(interval: float = 0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        observe("claudecohub_event_loop_lag_seconds", max(0.0, loop.time() - start - interval))
+
+
+def start():
+    global _lag_task
+    if METRICS_ENABLED and _lag_task is None:
+        _lag_task = asyncio.create_task(_lag_loop())
+
+
+async def stop():
+    global _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        try:
+            await _lag_task
+        except asyncio.CancelledError:
+            pass
+        _lag_task = None
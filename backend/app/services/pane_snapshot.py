@@ -0,0 +1,57 @@
+import time
+from typing import Iterable
+
+from ..config import SNAPSHOT_CACHE_TTL
+from . import tmux
+
+# session_id -> {(scrollback, escapes): (pane state, captured_at, content)}
+_cache: dict[str, dict[tuple[int, bool], tuple[tuple[int, ...], float, str]]] = {}
+
+
+def invalidate(session_id: str):
+    """Drop cached captures of a session; called when its pane produces output."""
+    _cache.pop(session_id, None)
+
+
+async def snapshots(
+    session_ids: Iterable[str], scrollback: int = 0, escapes: bool = False
+) -> dict[str, dict]:
+    """Return the current screen of each alive session among session_ids.
+
+    Captures are reused for up to SNAPSHOT_CACHE_TTL seconds while the pane's
+    activity time, history size and cursor are unchanged, so a page of
+    previews usually costs one list-sessions round-trip.
+    """
+    states = await tmux.pane_states()
+    wanted = [sid for sid in dict.fromkeys(session_ids) if sid in states]
+    key = (scrollback, escapes)
+    now = time.monotonic()
+
+    stale = []
+    for sid in wanted:
+        hit = _cache.get(sid, {}).get(key)
+        if hit is None or hit[0] != states[sid] or now - hit[1] > SNAPSHOT_CACHE_TTL:
+            stale.append(sid)
+    if stale:
+        captured = await tmux.capture_panes(stale, scrollback, escapes)
+        for sid, content in captured.items():
+            _cache.setdefault(sid, {})[key] = (states[sid], now, content)
+
+    # 已退出会话的缓存顺带清理
+    for sid in list(_cache):
+        if sid not in states:
+            del _cache[sid]
+
+    result = {}
+    for sid in wanted:
+        hit = _cache.get(sid, {}).get(key)
+        if hit is None:
+            continue
+        _, _, cursor_x, cursor_y, width, height = states[sid]
+        result[sid] = {
+            "content": hit[2],
+            "width": width,
+            "height": height,
+            "cursor": [cursor_x, cursor_y],
+        }
+    return result
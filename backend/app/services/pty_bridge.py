@@ -0,0 +1,191 @@
+import asyncio
+import fcntl
+import logging
+import os
+import pty
+import signal
+import struct
+import subprocess
+import termios
+from collections import deque
+from typing import Optional
+
+from ..config import TERMINAL_FRAME_INTERVAL, TERMINAL_FRAME_MAX_BYTES, TERMINAL_HIGH_WATER
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK = 65536
+
+
+class PtyBridge:
+    """A child process on a PTY whose master fd is driven by the event loop.
+
+    The master is non-blocking and registered with loop.add_reader /
+    add_writer, so an open terminal costs no executor thread and writes never
+    block the loop. Once more than TERMINAL_HIGH_WATER bytes of output are
+    waiting to be consumed the reader is paused, leaving the kernel's PTY
+    flow control to stall the producer until the consumer catches up.
+    """
+
+    def __init__(self, master_fd: int, proc: subprocess.Popen, tty: str = ""):
+        self.master_fd = master_fd
+        self.proc = proc
+        self.tty = tty
+        self._loop = asyncio.get_running_loop()
+        self._chunks: deque[bytes] = deque()
+        self._readable = asyncio.Event()
+        self._eof = False
+        self._buffered = 0
+        self._paused = False
+        self._last_frame_at = 0.0
+        self.bytes_read = 0
+        self.reads = 0
+        self.frames = 0
+        self._write_buf = bytearray()
+        self._writing = False
+        self._closed = False
+        os.set_blocking(master_fd, False)
+        self._loop.add_reader(master_fd, self._on_readable)
+
+    @classmethod
+    def spawn(cls, argv: list[str], rows: int = 24, cols: int = 80,
+              env: Optional[dict] = None) -> "PtyBridge":
+        master_fd, slave_fd = pty.openpty()
+        tty = os.ttyname(slave_fd)
+        try:
+            # 设置初始窗口大小
+            fcntl.ioctl(slave_fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+            proc = subprocess.Popen(
+                argv,
+                stdin=slave_fd, stdout=slave_fd, stderr=slave_fd,
+                env=env, preexec_fn=os.setsid,
+            )
+        except Exception:
+            os.close(master_fd)
+            raise
+        finally:
+            os.close(slave_fd)
+        return cls(master_fd, proc, tty)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.master_fd, READ_CHUNK)
+        except BlockingIOError:
+            return
+        except OSError:
+            # slave 端全部关闭后 Linux 返回 EIO
+            data = b""
+        if not data:
+            self._eof = True
+            self._loop.remove_reader(self.master_fd)
+        else:
+            self._chunks.append(data)
+            self._buffered += len(data)
+            self.bytes_read += len(data)
+            self.reads += 1
+            if self._buffered >= TERMINAL_HIGH_WATER:
+                self._paused = True
+                self._loop.remove_reader(self.master_fd)
+        self._readable.set()
+
+    def _pop(self, limit: int) -> bytes:
+        chunk = self._chunks.popleft()
+        if len(chunk) > limit:
+            self._chunks.appendleft(chunk[limit:])
+            chunk = chunk[:limit]
+        self._buffered -= len(chunk)
+        if self._paused and self._buffered <= TERMINAL_HIGH_WATER // 2 and not self._closed:
+            self._paused = False
+            self._loop.add_reader(self.master_fd, self._on_readable)
+        return chunk
+
+    async def _wait_readable(self, timeout: Optional[float] = None) -> bool:
+        self._readable.clear()
+        try:
+            await asyncio.wait_for(self._readable.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def read(self) -> bytes:
+        """Return the next chunk of output, or b"" once the child has closed the PTY."""
+        while not self._chunks:
+            if self._eof or self._closed:
+                return b""
+            await self._wait_readable()
+        return self._pop(READ_CHUNK)
+
+    async def read_frame(self) -> bytes:
+        """Return output coalesced into one frame, or b"" at EOF.
+
+        A frame is closed after TERMINAL_FRAME_MAX_BYTES or once
+        TERMINAL_FRAME_INTERVAL has passed without filling it. Isolated
+        output such as keystroke echo is returned without waiting.
+        """
+        first = await self.read()
+        if not first:
+            return b""
+        parts = [first]
+        size = len(first)
+        now = self._loop.time()
+        # 距上一帧已超过窗口说明不是连续输出，立即发送以免增加回显延迟
+        streaming = now - self._last_frame_at < TERMINAL_FRAME_INTERVAL
+        deadline = now + TERMINAL_FRAME_INTERVAL
+        while size < TERMINAL_FRAME_MAX_BYTES:
+            if self._chunks:
+                chunk = self._pop(TERMINAL_FRAME_MAX_BYTES - size)
+                parts.append(chunk)
+                size += len(chunk)
+                continue
+            remaining = deadline - self._loop.time()
+            if not streaming or self._eof or self._closed or remaining <= 0:
+                break
+            if not await self._wait_readable(remaining):
+                break
+        self._last_frame_at = self._loop.time()
+        self.frames += 1
+        return b"".join(parts)
+
+    def write(self, data: bytes):
+        if self._closed or not data:
+            return
+        self._write_buf += data
+        if not self._writing:
+            self._flush()
+
+    def _flush(self):
+        try:
+            while self._write_buf:
+                n = os.write(self.master_fd, self._write_buf)
+                del self._write_buf[:n]
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            logger.debug(f"pty write failed: {e}")
+            self._write_buf.clear()
+        if self._write_buf and not self._writing:
+            self._writing = True
+            self._loop.add_writer(self.master_fd, self._flush)
+        elif not self._write_buf and self._writing:
+            self._writing = False
+            self._loop.remove_writer(self.master_fd)
+
+    def resize(self, rows: int, cols: int):
+        fcntl.ioctl(self.master_fd, termios.TIOCSWINSZ,
+                    struct.pack("HHHH", rows, cols, 0, 0))
+        try:
+            os.kill(self.proc.pid, signal.SIGWINCH)
+        except ProcessLookupError:
+            pass
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._readable.set()
+        self._loop.remove_reader(self.master_fd)
+        self._loop.remove_writer(self.master_fd)
+        try:
+            os.close(self.master_fd)
+        except OSError:
+            pass
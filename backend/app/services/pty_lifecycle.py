@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+from typing import Optional
+
+from . import tmux
+from .pty_bridge import PtyBridge
+
+logger = logging.getLogger(__name__)
+
+# 标记由本服务启动的 attach 进程，值为所属服务进程的 pid，用于识别孤儿进程
+OWNER_ENV = "CLAUDECOHUB_OWNER"
+
+
+def child_env() -> dict:
+    env = os.environ.copy()
+    env["TERM"] = "xterm-256color"
+    env[OWNER_ENV] = str(os.getpid())
+    return env
+
+
+async def wait_exit(proc: subprocess.Popen, timeout: float) -> bool:
+    """Reap proc without blocking the loop; return False if it outlives timeout.
+
+    Uses a pidfd registered with the event loop where the kernel supports
+    it, and falls back to polling with a short interval otherwise.
+    """
+    if proc.poll() is not None:
+        return True
+    loop = asyncio.get_running_loop()
+    try:
+        pidfd = os.pidfd_open(proc.pid)
+    except (AttributeError, OSError):
+        pidfd = None
+
+    if pidfd is not None:
+        exited = loop.create_future()
+        loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+        try:
+            await asyncio.wait_for(exited, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+        return proc.poll() is not None
+
+    deadline = loop.time() + timeout
+    while proc.poll() is None:
+        if loop.time() >= deadline:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+
+async def terminate(bridge: PtyBridge):
+    """Detach a tmux attach client cleanly and reap it asynchronously.
+
+    The client is detached through tmux itself, and is only signalled if it
+    does not exit on its own.
+    """
+    proc = bridge.proc
+    if proc.poll() is None and bridge.tty:
+        await tmux.detach_client(bridge.tty)
+    bridge.close()
+    if await wait_exit(proc, 1):
+        return
+    for sig, grace in ((signal.SIGHUP, 1), (signal.SIGKILL, 2)):
+        try:
+            proc.send_signal(sig)
+        except ProcessLookupError:
+            return
+        if await wait_exit(proc, grace):
+            return
+    logger.warning(f"tmux client {proc.pid} did not exit")
+
+
+def _owner_pid(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/environ", "rb") as f:
+            environ = f.read().split(b"\0")
+    except OSError:
+        return None
+    prefix = OWNER_ENV.encode() + b"="
+    for item in environ:
+        if item.startswith(prefix):
+            value = item[len(prefix):]
+            return int(value) if value.isdigit() else None
+    return None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+async def cleanup_orphans() -> int:
+    """Detach attach clients left behind by a previous server process."""
+    count = 0
+    for pid, tty in await tmux.list_clients():
+        owner = _owner_pid(pid)
+        if owner is None or owner == os.getpid() or _pid_alive(owner):
+            continue
+        await tmux.detach_client(tty)
+        try:
+            os.kill(pid, signal.SIGHUP)
+        except ProcessLookupError:
+            pass
+        count += 1
+    if count:
+        logger.info(f"Detached {count} orphaned tmux attach clients")
+    return count
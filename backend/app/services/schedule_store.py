@@ -0,0 +1,152 @@
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+import yaml
+
+from ..config import SCHEDULES_DIR, YAML_LOADER, encode_path_for_claude
+
+logger = logging.getLogger(__name__)
+
+# 旧版所有用户共用的单一文件，首次使用时拆分到 SHARD_DIR
+LEGACY_FILE = SCHEDULES_DIR / "schedules.yaml"
+# 每个 workdir 一个 yaml 分片，修改只会重写该用户自己的文件
+SHARD_DIR = SCHEDULES_DIR / "schedules.d"
+
+# shard path -> ((mtime_ns, size), parsed schedules)
+_cache: dict[Path, tuple[tuple[int, int], list[dict]]] = {}
+_locks: dict[Path, threading.Lock] = {}
+_locks_guard = threading.Lock()
+_migrated = False
+
+
+def _shard_path(workdir: str) -> Path:
+    # 编码后的路径可能重名（a/b-c 与 a/b/c），加上原始路径的哈希区分
+    digest = hashlib.sha1(workdir.encode()).hexdigest()[:12]
+    return SHARD_DIR / f"{encode_path_for_claude(Path(workdir)) or '_'}-{digest}.yaml"
+
+
+def _lock_for(path: Path) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(path, threading.Lock())
+
+
+def _copy(schedules: list[dict]) -> list[dict]:
+    return [dict(s) for s in schedules]
+
+
+def _read(path: Path) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        data = yaml.load(f, Loader=YAML_LOADER)
+    return data if isinstance(data, list) else []
+
+
+def _dump(path: Path, schedules: list[dict]):
+    """Write atomically: dump to a temp file in the same dir, then rename over."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            yaml.dump(schedules, f, default_flow_style=False, allow_unicode=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _write(path: Path, schedules: list[dict]):
+    _dump(path, schedules)
+    st = path.stat()
+    _cache[path] = ((st.st_mtime_ns, st.st_size), _copy(schedules))
+
+
+def _load_shard(path: Path) -> list[dict]:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        _cache.pop(path, None)
+        return []
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    data = _read(path)
+    _cache[path] = (key, data)
+    return data
+
+
+def _migrate_legacy():
+    """Split the legacy single file into shards, once.
+
+    Shards are written to a staging dir that is renamed to SHARD_DIR only
+    when complete, so a crash mid-way leaves the legacy file in charge and
+    the split is redone on the next start.
+    """
+    global _migrated
+    if _migrated:
+        return
+    _migrated = True
+    if not LEGACY_FILE.exists() or SHARD_DIR.exists():
+        return
+    staging = SHARD_DIR.with_name(SHARD_DIR.name + ".tmp")
+    with open(SCHEDULES_DIR / "schedules.migrate.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # 其他进程可能已在我们等锁期间完成了迁移
+        if SHARD_DIR.exists():
+            return
+        shutil.rmtree(staging, ignore_errors=True)
+        by_workdir: dict[str, list[dict]] = {}
+        for s in _read(LEGACY_FILE):
+            by_workdir.setdefault(s.get("workdir", ""), []).append(s)
+        staging.mkdir(parents=True)
+        for workdir, schedules in by_workdir.items():
+            _dump(staging / _shard_path(workdir).name, schedules)
+        os.replace(staging, SHARD_DIR)
+        LEGACY_FILE.rename(LEGACY_FILE.with_suffix(".yaml.migrated"))
+    logger.info(f"Split {LEGACY_FILE} into {len(by_workdir)} per-workdir shards")
+
+
+def load(workdir: str) -> list[dict]:
+    """Return a copy of one workdir's schedules, re-parsed only if the shard changed."""
+    _migrate_legacy()
+    return _copy(_load_shard(_shard_path(workdir)))
+
+
+def load_all() -> list[dict]:
+    _migrate_legacy()
+    if not SHARD_DIR.exists():
+        return []
+    result = []
+    for path in sorted(SHARD_DIR.glob("*.yaml")):
+        result.extend(_load_shard(path))
+    return _copy(result)
+
+
+@contextmanager
+def modify(workdir: str) -> Iterator[list[dict]]:
+    """Read-modify-write one workdir's schedules under a lock.
+
+    Holds a thread lock plus an flock on the shard's lock file, so writers in
+    other worker processes are serialized too. The yielded list is saved when
+    the block exits without raising.
+    """
+    _migrate_legacy()
+    path = _shard_path(workdir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _lock_for(path), open(path.with_suffix(".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        schedules = _copy(_load_shard(path))
+        yield schedules
+        _write(path, schedules)
@@ -1,106 +1,184 @@
 import asyncio
 import logging
-from datetime import datetime
+import uuid
 from pathlib import Path
 
-import yaml
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from ..config import SCHEDULES_DIR, get_user_workdir
+from ..config import WORKDIR_BASE, TASK_MISFIRE_GRACE, get_user_workdir
+from . import schedule_store, usage
+from .task_logs import RunLog
+from .task_runner import runner
 
 logger = logging.getLogger(__name__)
 
 scheduler = AsyncIOScheduler()
 
-SCHEDULE_FILE = SCHEDULES_DIR / "schedules.yaml"
-
 
 async def run_claude_task(username: str, task_id: str, content: str, workdir: str):
-    log_file = SCHEDULES_DIR / "task_output.log"
-    log_file.parent.mkdir(parents=True, exist_ok=True)
-
-    timestamp = datetime.now().isoformat()
-    header = f"\n{'='*60}\n[{timestamp}] Task: {task_id}\nPrompt: {content}\n{'='*60}\n"
-
+    # 固定会话 id，用量汇总据此把这次运行的 token 计到该任务名下
+    session_id = str(uuid.uuid4())
+    run_log = RunLog(task_id, username, workdir, content, session_id)
     cwd = workdir or str(get_user_workdir(username))
-    proc = await asyncio.create_subprocess_shell(
-        f'claude -p "{content}"',
-        cwd=cwd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.STDOUT,
+    rc = None
+    proc = None
+    try:
+        await usage.tag_session(session_id, task_id)
+    except Exception as e:
+        logger.warning(f"Failed to tag session of task {task_id}: {e}")
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            # "--" 之后的提示词即使以 - 开头也不会被当作参数
+            "claude", "-p", "--session-id", session_id, "--", content,
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        # 边运行边落盘，不在内存中累积整段输出
+        while True:
+            chunk = await proc.stdout.read(65536)
+            if not chunk:
+                break
+            run_log.write(chunk)
+        rc = await proc.wait()
+    except OSError as e:
+        run_log.write(f"Failed to start claude: {e}\n".encode())
+    except asyncio.CancelledError:
+        # 任务队列停止时不留下孤儿进程
+        if proc is not None and proc.returncode is None:
+            proc.kill()
+        raise
+    finally:
+        await run_log.finish(rc)
+
+    logger.info(f"Task {task_id} for {username} completed (rc={rc}, run={run_log.run_id})")
+
+
+async def enqueue_claude_task(
+    username: str, task_id: str, content: str, workdir: str, priority: int = 0
+):
+    """Cron entry point: hand the run to the task runner instead of starting it now.
+
+    A coroutine so APScheduler runs it on the event loop, which the runner's
+    heap and wakeup event belong to, rather than in a worker thread.
+    """
+    runner.submit(
+        f"{workdir}:{task_id}",
+        username,
+        lambda: run_claude_task(username, task_id, content, workdir),
+        priority,
     )
-    stdout, _ = await proc.communicate()
-    output = stdout.decode(errors="replace")
 
-    with open(log_file, "a") as f:
-        f.write(header + output + "\n")
 
-    logger.info(f"Task {task_id} for {username} completed (rc={proc.returncode})")
+def _username_for(workdir: str) -> str:
+    path = Path(workdir)
+    return path.name if path.parent == WORKDIR_BASE else ""
 
 
 def load_schedules(workdir: str = "") -> list[dict]:
-    if not SCHEDULE_FILE.exists():
-        return []
-    with open(SCHEDULE_FILE) as f:
-        data = yaml.safe_load(f)
-    if not isinstance(data, list):
-        return []
     if workdir:
-        return [s for s in data if s.get("workdir") == workdir]
-    return data
+        return schedule_store.load(workdir)
+    return schedule_store.load_all()
 
 
 def _load_all_schedules() -> list[dict]:
-    if not SCHEDULE_FILE.exists():
-        return []
-    with open(SCHEDULE_FILE) as f:
-        data = yaml.safe_load(f)
-    return data if isinstance(data, list) else []
-
-
-def save_schedules(schedules: list[dict], workdir: str = ""):
-    SCHEDULE_FILE.parent.mkdir(parents=True, exist_ok=True)
-    if workdir:
-        # 只替换该workdir的任务，保留其他用户的
-        all_schedules = _load_all_schedules()
-        all_schedules = [s for s in all_schedules if s.get("workdir") != workdir]
-        all_schedules.extend(schedules)
-    else:
-        all_schedules = schedules
-    with open(SCHEDULE_FILE, "w") as f:
-        yaml.dump(all_schedules, f, default_flow_style=False, allow_unicode=True)
+    return schedule_store.load_all()
 
 
 def _job_id(name: str, workdir: str) -> str:
     return f"schedule_{workdir}_{name}"
 
 
-def reload_schedules():
-    # Remove all schedule jobs
-    for job in scheduler.get_jobs():
-        if job.id.startswith("schedule_"):
-            scheduler.remove_job(job.id)
+# job_id -> 已应用到调度器的任务定义，用于增量比对
+_applied: dict[str, dict] = {}
+_jobs_by_workdir: dict[str, set[str]] = {}
+
 
-    # Re-add from file
-    schedules = _load_all_schedules()
+def _desired_jobs(schedules: list[dict]) -> dict[str, dict]:
+    desired = {}
     for s in schedules:
         if not s.get("enabled", True):
             continue
-        job_id = _job_id(s["name"], s.get("workdir", ""))
+        workdir = s.get("workdir", "")
+        job_id = _job_id(s["name"], workdir)
         cron = s.get("cron", "")
         parts = cron.split()
         if len(parts) != 5:
             logger.warning(f"Invalid cron '{cron}' for job {job_id}")
             continue
-        scheduler.add_job(
-            run_claude_task,
-            "cron",
-            id=job_id,
-            minute=parts[0],
-            hour=parts[1],
-            day=parts[2],
-            month=parts[3],
-            day_of_week=parts[4],
-            args=["", s["name"], s["content"], s.get("workdir", "")],
-            replace_existing=True,
-        )
+        desired[job_id] = {
+            "workdir": workdir,
+            "cron": dict(zip(("minute", "hour", "day", "month", "day_of_week"), parts)),
+            "args": [_username_for(workdir), s["name"], s["content"], workdir,
+                     int(s.get("priority", 0))],
+        }
+    return desired
+
+
+def _forget(job_id: str):
+    spec = _applied.pop(job_id, None)
+    if spec is not None:
+        _jobs_by_workdir.get(spec["workdir"], set()).discard(job_id)
+
+
+def _remember(job_id: str, spec: dict):
+    _applied[job_id] = spec
+    _jobs_by_workdir.setdefault(spec["workdir"], set()).add(job_id)
+
+
+def reload_schedules(workdir: str = "") -> dict[str, int]:
+    """Reconcile scheduler jobs with the schedule file, touching only what changed.
+
+    With workdir set, only that workdir's schedules and jobs are compared.
+    Unchanged jobs keep their next fire time; a changed prompt or priority is
+    applied in place, and only a changed cron expression reschedules.
+    """
+    schedules = load_schedules(workdir) if workdir else _load_all_schedules()
+    desired = _desired_jobs(schedules)
+    if workdir:
+        current = set(_jobs_by_workdir.get(workdir, ()))
+    else:
+        current = {job.id for job in scheduler.get_jobs() if job.id.startswith("schedule_")}
+
+    counts = {"added": 0, "modified": 0, "removed": 0, "unchanged": 0}
+    for job_id in current - desired.keys():
+        if scheduler.get_job(job_id) is not None:
+            scheduler.remove_job(job_id)
+        _forget(job_id)
+        counts["removed"] += 1
+
+    for job_id, spec in desired.items():
+        old = _applied.get(job_id)
+        try:
+            if old is None or scheduler.get_job(job_id) is None:
+                scheduler.add_job(
+                    enqueue_claude_task,
+                    "cron",
+                    id=job_id,
+                    args=spec["args"],
+                    misfire_grace_time=int(TASK_MISFIRE_GRACE),
+                    coalesce=True,
+                    replace_existing=True,
+                    **spec["cron"],
+                )
+                counts["added"] += 1
+            elif old != spec:
+                if old["cron"] != spec["cron"]:
+                    scheduler.reschedule_job(job_id, trigger="cron", **spec["cron"])
+                if old["args"] != spec["args"]:
+                    scheduler.modify_job(job_id, args=spec["args"])
+                counts["modified"] += 1
+            else:
+                counts["unchanged"] += 1
+                continue
+        except ValueError as e:
+            logger.warning(f"Invalid cron {spec['cron']} for job {job_id}: {e}")
+            if scheduler.get_job(job_id) is not None:
+                scheduler.remove_job(job_id)
+            _forget(job_id)
+            continue
+        _remember(job_id, spec)
+
+    if counts["added"] or counts["modified"] or counts["removed"]:
+        logger.info(f"Schedules reconciled: {counts}")
+    return counts
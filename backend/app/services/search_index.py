@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+from ..config import (
+    SCHEDULES_DIR,
+    SEARCH_INDEX_INTERVAL,
+    SEARCH_MAX_TEXT_CHARS,
+    TRANSCRIPT_MAX_LINE_BYTES,
+    get_claude_project_dir,
+)
+from .claude_session import UUID_RE, read_line
+from .transcript_index import TranscriptIndex, list_usernames
+
+logger = logging.getLogger(__name__)
+
+SEARCH_DB = SCHEDULES_DIR / "search.db"
+
+# 单次事务最多写入的消息数，避免长时间持有写锁
+_COMMIT_EVERY = 2000
+
+# 表结构变化时递增；旧库整份丢弃，从对话记录重建
+_SCHEMA_VERSION = 1
+_RESET = """
+DROP TABLE IF EXISTS messages;
+DROP TABLE IF EXISTS message_paths;
+DROP TABLE IF EXISTS files;
+"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    inode INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    lines INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+    text,
+    path UNINDEXED,
+    username UNINDEXED,
+    session_id UNINDEXED,
+    offset UNINDEXED,
+    idx UNINDEXED,
+    role UNINDEXED,
+    timestamp UNINDEXED
+);
+-- FTS5 的 UNINDEXED 列不能走索引，按文件删除时经这张表取 rowid
+CREATE TABLE IF NOT EXISTS message_paths (
+    rowid INTEGER PRIMARY KEY,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS message_paths_path ON message_paths (path);
+"""
+
+
+def _extract_text(obj: dict) -> str:
+    """Searchable text of one transcript entry: message text, tool inputs and results."""
+    msg = obj.get("message")
+    content = msg.get("content") if isinstance(msg, dict) else obj.get("content")
+    if isinstance(content, str):
+        return content[:SEARCH_MAX_TEXT_CHARS]
+    parts: list[str] = []
+    if isinstance(content, list):
+        for c in content:
+            if not isinstance(c, dict):
+                continue
+            kind = c.get("type")
+            if kind == "text":
+                parts.append(str(c.get("text", "")))
+            elif kind == "tool_use":
+                parts.append(f"{c.get('name', '')} {json.dumps(c.get('input'), ensure_ascii=False)}")
+            elif kind == "tool_result":
+                result = c.get("content")
+                if isinstance(result, list):
+                    result = " ".join(
+                        str(r.get("text", "")) for r in result if isinstance(r, dict)
+                    )
+                parts.append(str(result or ""))
+    return "\n".join(parts)[:SEARCH_MAX_TEXT_CHARS]
+
+
+def _index_file(conn: sqlite3.Connection, path: Path, username: str, row) -> int:
+    """Index the lines appended to path since the stored offset; returns rows added."""
+    st = path.stat()
+    key = str(path)
+    if row is not None:
+        inode, offset, lines = row
+        if inode != st.st_ino or st.st_size < offset:
+            # 文件被替换或截断，整份重建
+            _delete_path(conn, key)
+            row = None
+        elif st.st_size == offset:
+            return 0
+    if row is None:
+        offset, lines = 0, 0
+
+    added = 0
+    batch = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            head, n, complete = read_line(f, TRANSCRIPT_MAX_LINE_BYTES)
+            if not complete:
+                break
+            line_start = offset
+            offset += n
+            if not head.strip():
+                continue
+            idx = lines
+            lines += 1
+            if n > len(head):
+                continue
+            try:
+                obj = json.loads(head)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            if not isinstance(obj, dict):
+                continue
+            text = _extract_text(obj)
+            if not text.strip():
+                continue
+            msg = obj.get("message")
+            role = msg.get("role", "") if isinstance(msg, dict) else ""
+            batch.append((
+                text, key, username, path.stem, line_start, idx,
+                role or obj.get("type", ""), obj.get("timestamp", ""),
+            ))
+            if len(batch) >= _COMMIT_EVERY:
+                added += _flush(conn, batch, key, username, path.stem, st.st_ino, offset, lines)
+    added += _flush(conn, batch, key, username, path.stem, st.st_ino, offset, lines)
+    return added
+
+
+def _delete_path(conn: sqlite3.Connection, path: str):
+    """Drop one file's messages by rowid instead of scanning the FTS table."""
+    conn.execute(
+        "DELETE FROM messages WHERE rowid IN (SELECT rowid FROM message_paths WHERE path = ?)",
+        (path,),
+    )
+    conn.execute("DELETE FROM message_paths WHERE path = ?", (path,))
+
+
+def _flush(conn, batch, key, username, session_id, inode, offset, lines) -> int:
+    """Write a batch of messages together with the file position that covers them."""
+    n = len(batch)
+    # 两张表用同一组显式 rowid；只有写线程插入，取当前最大值即可
+    start = conn.execute("SELECT coalesce(max(rowid), 0) + 1 FROM message_paths").fetchone()[0]
+    conn.executemany(
+        "INSERT INTO message_paths (rowid, path) VALUES (?, ?)",
+        [(start + i, key) for i in range(n)],
+    )
+    conn.executemany(
+        "INSERT INTO messages (rowid, text, path, username, session_id, offset, idx, role, timestamp)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(start + i, *row) for i, row in enumerate(batch)],
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO files (path, username, session_id, inode, offset, lines)"
+        " VALUES (?, ?, ?, ?, ?, ?)",
+        (key, username, session_id, inode, offset, lines),
+    )
+    conn.commit()
+    batch.clear()
+    return n
+
+
+def _update(conn: sqlite3.Connection, usernames: Optional[list[str]]) -> int:
+    """Bring the index up to date with every user's transcripts; returns rows added.
+
+    Only bytes appended since the last pass are parsed. Runs on the index
+    writer thread.
+    """
+    known = {
+        path: (inode, offset, lines)
+        for path, inode, offset, lines in conn.execute(
+            "SELECT path, inode, offset, lines FROM files"
+        )
+    }
+    full_pass = usernames is None
+    if usernames is None:
+        usernames = list_usernames()
+    seen: set[str] = set()
+    added = 0
+    for username in usernames:
+        project_dir = get_claude_project_dir(username)
+        try:
+            entries = list(os.scandir(project_dir))
+        except OSError:
+            continue
+        for de in entries:
+            if not de.name.endswith(".jsonl") or not UUID_RE.match(de.name[:-6]):
+                continue
+            seen.add(de.path)
+            try:
+                added += _index_file(conn, Path(de.path), username, known.get(de.path))
+            except OSError as e:
+                logger.debug(f"Search indexing skipped {de.path}: {e}")
+    if full_pass:
+        for path in known.keys() - seen:
+            _delete_path(conn, path)
+            conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        conn.commit()
+    return added
+
+
+_index = TranscriptIndex("Search index", SEARCH_DB, _SCHEMA, _update,
+                         SEARCH_INDEX_INTERVAL, full_pass_on_delete=True,
+                         schema_version=_SCHEMA_VERSION, reset=_RESET)
+update = _index.update
+update_async = _index.update_async
+apply_changes = _index.apply_changes
+start = _index.start
+stop = _index.stop
+
+
+def _match_expr(query: str) -> str:
+    # 每个词按短语处理，避免用户输入被当作 FTS5 语法
+    return " ".join('"' + t.replace('"', '""') + '"' for t in query.split())
+
+
+def search(query: str, username: Optional[str] = None, limit: int = 20) -> list[dict]:
+    """Ranked hits for query, best first; username=None searches every user."""
+    expr = _match_expr(query)
+    if not expr or not SEARCH_DB.exists():
+        return []
+    sql = (
+        "SELECT username, session_id, offset, idx, role, timestamp,"
+        " snippet(messages, 0, '[', ']', '…', 16), bm25(messages)"
+        " FROM messages WHERE messages MATCH ?"
+    )
+    params: list = [expr]
+    if username is not None:
+        sql += " AND username = ?"
+        params.append(username)
+    sql += " ORDER BY rank LIMIT ?"
+    params.append(limit)
+    try:
+        rows = _index.reader_conn().execute(sql, params).fetchall()
+    except sqlite3.OperationalError as e:
+        # 索引尚未建立
+        logger.debug(f"Search query failed: {e}")
+        return []
+    return [
+        {
+            "user": user,
+            "session_id": sid,
+            "offset": offset,
+            "index": idx,
+            "role": role,
+            "timestamp": ts,
+            "snippet": snippet,
+            "score": -score,
+        }
+        for user, sid, offset, idx, role, ts, snippet, score in rows
+    ]
+
+
+async def search_async(query: str, username: Optional[str] = None, limit: int = 20) -> list[dict]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, search, query, username, limit)
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Optional
+
+from ..config import POOL_SIZE, POOL_ACTIVE_WINDOW, POOL_MAX_AGE
+from . import session_reaper, status_monitor, tmux
+
+logger = logging.getLogger(__name__)
+
+# 预热会话的 tmux 名：内部前缀 + 已分配的 session_id，交付时改名为 session_id
+WARM_PREFIX = tmux.INTERNAL_PREFIX + "warm_"
+# 没有新请求时检查补充/过期的间隔（秒）
+_CHECK_INTERVAL = 30.0
+
+# username -> (工作目录, 最近访问时间)
+_active: dict[str, tuple[str, float]] = {}
+# username -> [(session_id, 工作目录, 启动时间)]，先启动的先交付
+_pool: dict[str, deque[tuple[str, str, float]]] = {}
+_stats = {"hits": 0, "misses": 0, "started": 0, "discarded": 0}
+_wake = asyncio.Event()
+_task: Optional[asyncio.Task] = None
+
+
+def _warm_name(session_id: str) -> str:
+    return WARM_PREFIX + session_id
+
+
+def note_active(username: str, workdir: str):
+    """Keep warm sessions ready for a user who is using the dashboard."""
+    if POOL_SIZE <= 0:
+        return
+    known = _active.get(username)
+    _active[username] = (workdir, time.monotonic())
+    if known is None or known[0] != workdir:
+        _wake.set()
+
+
+async def acquire(username: str, workdir: str) -> Optional[str]:
+    """Hand out a pre-started session for workdir, or None when the pool is empty.
+
+    The returned session is already running claude under its final name.
+    """
+    if POOL_SIZE <= 0:
+        return None
+    note_active(username, workdir)
+    queue = _pool.get(username)
+    while queue:
+        sid, wd, _ = queue.popleft()
+        if wd == workdir and await tmux.rename_session(_warm_name(sid), sid):
+            # 改名后已出现在会话列表中，上报按普通会话处理
+            status_monitor.keep_reports(sid, False)
+            _stats["hits"] += 1
+            _wake.set()
+            return sid
+        # 目录已变或会话已退出
+        await _discard(sid)
+    _stats["misses"] += 1
+    _wake.set()
+    return None
+
+
+async def _discard(session_id: str):
+    status_monitor.keep_reports(session_id, False)
+    await tmux.kill_session(_warm_name(session_id))
+    _stats["discarded"] += 1
+
+
+async def _refill():
+    now = time.monotonic()
+    for username, (_, seen) in list(_active.items()):
+        if now - seen > POOL_ACTIVE_WINDOW:
+            del _active[username]
+
+    alive = set(await tmux.list_tmux_sessions(include_internal=True))
+    # 内存紧张时不再预热，已有的也一并释放
+    target = 0 if session_reaper.memory_low() else POOL_SIZE
+
+    for username in list(_pool.keys() | _active.keys()):
+        queue = _pool.setdefault(username, deque())
+        active = _active.get(username)
+        # 先同步整理队列再执行 tmux 命令，期间 acquire 可能从队列取走会话
+        discard = []
+        for entry in list(queue):
+            sid, wd, started = entry
+            if _warm_name(sid) not in alive:
+                queue.remove(entry)
+                status_monitor.keep_reports(sid, False)
+            elif active is None or wd != active[0] or now - started > POOL_MAX_AGE:
+                queue.remove(entry)
+                discard.append(sid)
+        while len(queue) > target:
+            discard.append(queue.pop()[0])
+        for sid in discard:
+            await _discard(sid)
+
+        while active is not None and len(queue) < target:
+            sid = str(uuid.uuid4())
+            if not await tmux.create_session(sid, active[0], name=_warm_name(sid)):
+                logger.warning(f"Failed to pre-start a session for {username}")
+                break
+            # 预热期间钩子已开始上报，交付前不在会话列表中，上报不能按超时清掉
+            status_monitor.keep_reports(sid)
+            queue.append((sid, active[0], time.monotonic()))
+            _stats["started"] += 1
+        if not queue and active is None:
+            del _pool[username]
+
+
+async def _refill_loop():
+    while True:
+        try:
+            await _refill()
+        except Exception as e:
+            logger.warning(f"Session pool refill failed: {e}")
+        try:
+            await asyncio.wait_for(_wake.wait(), _CHECK_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+
+
+def stats() -> dict:
+    served = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "warm": sum(len(q) for q in _pool.values()),
+        "users": len(_active),
+        "hit_rate": _stats["hits"] / served if served else None,
+    }
+
+
+async def _kill_all_warm():
+    for name in await tmux.list_tmux_sessions(include_internal=True):
+        if name.startswith(WARM_PREFIX):
+            await tmux.kill_session(name)
+    for queue in _pool.values():
+        for sid, _, _ in queue:
+            status_monitor.keep_reports(sid, False)
+    _pool.clear()
+
+
+async def start():
+    global _task
+    # 上次运行遗留的预热会话不知道属于谁，直接清掉
+    await _kill_all_warm()
+    if POOL_SIZE > 0:
+        _task = asyncio.create_task(_refill_loop())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    await _kill_all_warm()
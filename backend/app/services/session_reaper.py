@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Optional
+
+from ..config import (
+    WORKDIR_BASE,
+    REAPER_INTERVAL,
+    SESSION_MIN_IDLE,
+    SESSION_IDLE_TIMEOUT,
+    SESSION_MAX_PER_USER,
+    SESSION_MAX_TOTAL,
+    REAPER_MIN_FREE_MEM_PERCENT,
+)
+from . import claude_session, metrics, status_monitor, terminal_hub, tmux
+from .claude_session import UUID_RE
+
+logger = logging.getLogger(__name__)
+
+# 这些状态下会话仍在干活，不论空闲多久都不回收
+_BUSY = ("working", "idle+bg", "waiting")
+
+# session_id -> 最近一次打开/关闭终端的时间（epoch 秒），补充 tmux 的活动时间
+_touched: dict[str, float] = {}
+# 被回收的会话：session_id -> (所属用户, 工作目录)，再次打开时据此恢复
+_evicted: dict[str, tuple[str, str]] = {}
+# session_id -> [恢复锁, 持有或等待该锁的请求数]，计数归零才删除
+_resume_locks: dict[str, list] = {}
+_task: Optional[asyncio.Task] = None
+
+
+def touch(session_id: str):
+    """Record that someone opened or left the session's terminal."""
+    _touched[session_id] = time.time()
+
+
+def is_evicted(session_id: str) -> bool:
+    return session_id in _evicted
+
+
+def forget(session_id: str):
+    _evicted.pop(session_id, None)
+    _touched.pop(session_id, None)
+
+
+def _owner(path: str) -> Optional[str]:
+    try:
+        rel = Path(path).relative_to(WORKDIR_BASE)
+    except ValueError:
+        return None
+    return rel.parts[0] if rel.parts else None
+
+
+def memory_low() -> bool:
+    """True when MemAvailable is below REAPER_MIN_FREE_MEM_PERCENT of MemTotal."""
+    if REAPER_MIN_FREE_MEM_PERCENT <= 0:
+        return False
+    info = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                info[key] = int(value.split()[0])
+    except (OSError, ValueError, IndexError):
+        return False
+    total = info.get("MemTotal")
+    available = info.get("MemAvailable")
+    if not total or available is None:
+        return False
+    return available * 100 / total < REAPER_MIN_FREE_MEM_PERCENT
+
+
+def _pick_victims(sessions: dict[str, tuple[int, int, str]], statuses: dict[str, str],
+                  now: float) -> dict[str, str]:
+    """Choose sessions to stop: {session_id: reason}, least recently used first."""
+    counts: dict[str, int] = {}
+    # (最近活动时间, session_id, 所属用户)
+    candidates: list[tuple[float, str, str]] = []
+    for sid, (activity, attached, path) in sessions.items():
+        owner = _owner(path)
+        if owner is None or not UUID_RE.match(sid):
+            # 不是由本服务创建的会话
+            continue
+        counts[owner] = counts.get(owner, 0) + 1
+        last = max(activity, _touched.get(sid, 0))
+        if (attached or terminal_hub.viewer_count(sid) or statuses.get(sid) in _BUSY
+                or now - last < SESSION_MIN_IDLE):
+            continue
+        candidates.append((last, sid, owner))
+    candidates.sort()
+
+    victims: dict[str, str] = {}
+    if SESSION_IDLE_TIMEOUT > 0:
+        for last, sid, _ in candidates:
+            if now - last >= SESSION_IDLE_TIMEOUT:
+                victims[sid] = "idle"
+    if SESSION_MAX_PER_USER > 0:
+        remaining = dict(counts)
+        for _, sid, owner in candidates:
+            if sid in victims:
+                remaining[owner] -= 1
+        for _, sid, owner in candidates:
+            if remaining[owner] > SESSION_MAX_PER_USER and sid not in victims:
+                victims[sid] = "user_cap"
+                remaining[owner] -= 1
+    if SESSION_MAX_TOTAL > 0:
+        excess = sum(counts.values()) - len(victims) - SESSION_MAX_TOTAL
+        for _, sid, _ in candidates:
+            if excess <= 0:
+                break
+            if sid not in victims:
+                victims[sid] = "total_cap"
+                excess -= 1
+    if not victims and candidates and memory_low():
+        # 内存紧张时每轮只回收一个，下一轮再看是否缓解
+        victims[candidates[0][1]] = "memory"
+    return victims
+
+
+async def reap_once() -> list[str]:
+    """Stop the idle sessions that exceed the limits; returns their ids."""
+    sessions = await tmux.session_activity()
+    for sid in list(_touched):
+        if sid not in sessions:
+            del _touched[sid]
+    victims = _pick_victims(sessions, status_monitor.snapshot(), time.time())
+
+    users = set()
+    for sid, reason in victims.items():
+        _, _, path = sessions[sid]
+        owner = _owner(path)
+        # 先登记再结束，避免并发的打开请求把它当作普通的已结束会话
+        _evicted[sid] = (owner, path)
+        if not await tmux.kill_session(sid):
+            _evicted.pop(sid, None)
+            continue
+        status_monitor.mark(sid, None)
+        metrics.inc("claudecohub_sessions_evicted_total", reason=reason)
+        logger.info(f"Evicted idle session {sid} of {owner} ({reason})")
+        users.add(owner)
+    status_monitor.notify_sessions(users)
+    return [sid for sid in victims if sid in _evicted]
+
+
+async def ensure_alive(username: str, session_id: str, workdir: str,
+                       allow_dead: bool = False) -> bool:
+    """Make sure the session runs in tmux, resuming it if it was evicted.
+
+    An evicted session comes back in its owner's directory and only for its
+    owner. A session that exited on its own is only restarted with
+    allow_dead (an explicit resume), and then the caller's own transcript
+    must exist. Returns False when there is nothing to resume.
+    """
+    if await tmux.session_exists(session_id):
+        return True
+    if not allow_dead and session_id not in _evicted:
+        return False
+    entry = _resume_locks.setdefault(session_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            # 多个标签页同时打开时只恢复一次
+            if await tmux.session_exists(session_id):
+                return True
+            evicted = _evicted.get(session_id)
+            if evicted and evicted[0] != username or not evicted and not allow_dead:
+                return False
+            owner, cwd = evicted if evicted else (username, workdir)
+            path = claude_session.transcript_path(owner, session_id)
+            if path is not None and path.is_file():
+                ok = await tmux.resume_session(session_id, cwd)
+            elif evicted:
+                # 回收前还没说过话的会话没有记录可恢复，用同一 id 重新开
+                ok = await tmux.create_session(session_id, cwd)
+            else:
+                return False
+            if not ok:
+                return False
+            _evicted.pop(session_id, None)
+            touch(session_id)
+            status_monitor.mark(session_id, "idle", owner)
+            metrics.inc("claudecohub_sessions_resumed_total")
+            return True
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            _resume_locks.pop(session_id, None)
+
+
+async def _reap_loop():
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL)
+        try:
+            await reap_once()
+        except Exception as e:
+            logger.warning(f"Session reaping failed: {e}")
+
+
+def start():
+    global _task
+    _task = asyncio.create_task(_reap_loop())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import os
+import shlex
+import socket
+import sys
+from typing import Optional
+
+from ..config import CLAUDE_SETTINGS_FILE, SCHEDULES_DIR, STATUS_HOOKS, STATUS_HOOK_SOCKET
+from . import metrics, status_monitor
+
+logger = logging.getLogger(__name__)
+
+HOOK_SCRIPT = SCHEDULES_DIR / "status_hook.py"
+
+# 钩子事件 -> 会话状态；None 表示会话结束
+_EVENT_STATUS = {
+    "SessionStart": "idle",
+    "UserPromptSubmit": "working",
+    "PreToolUse": "working",
+    "PostToolUse": "working",
+    "Stop": "idle",
+    "SessionEnd": None,
+}
+_EVENTS = (*_EVENT_STATUS, "Notification")
+# 这些事件按工具名匹配，空 matcher 表示全部
+_TOOL_EVENTS = ("PreToolUse", "PostToolUse")
+
+# 每次触发钩子都会运行这段脚本：只转发事件名和会话 id，hub 不在时静默退出，
+# 不向 stdout 输出任何内容（UserPromptSubmit 会把输出拼进上下文）
+_SCRIPT = """\
+import json, socket, sys
+try:
+    data = json.load(sys.stdin)
+    msg = {{
+        "event": data.get("hook_event_name"),
+        "session_id": data.get("session_id"),
+        "notification_type": data.get("notification_type"),
+        "message": str(data.get("message") or "")[:200],
+    }}
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    s.setblocking(False)
+    s.sendto(json.dumps(msg).encode(), {socket!r})
+except Exception:
+    pass
+"""
+
+_transport: Optional[asyncio.DatagramTransport] = None
+
+
+def _hook_command() -> str:
+    # -S 跳过 site，钩子启动更快；脚本只用标准库
+    return f"{shlex.quote(sys.executable)} -S {shlex.quote(str(HOOK_SCRIPT))}"
+
+
+def _is_ours(entry) -> bool:
+    return isinstance(entry, dict) and any(
+        isinstance(h, dict) and str(HOOK_SCRIPT) in str(h.get("command", ""))
+        for h in entry.get("hooks", [])
+    )
+
+
+def install(enabled: bool = True) -> bool:
+    """Add (or with enabled=False remove) our hooks in the user-level settings.
+
+    Other hooks are left as they are. Returns True when the file changed.
+    Sessions started afterwards report their state; running ones keep
+    being probed by capture-pane.
+    """
+    try:
+        settings = json.loads(CLAUDE_SETTINGS_FILE.read_text()) if CLAUDE_SETTINGS_FILE.exists() else {}
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Not touching {CLAUDE_SETTINGS_FILE}: {e}")
+        return False
+    if not isinstance(settings, dict) or not isinstance(settings.get("hooks", {}), dict):
+        logger.warning(f"Not touching {CLAUDE_SETTINGS_FILE}: unexpected layout")
+        return False
+
+    hooks = settings.get("hooks", {})
+    before = json.dumps(hooks, sort_keys=True)
+    for event in _EVENTS:
+        entries = [e for e in hooks.get(event, []) if not _is_ours(e)]
+        if enabled:
+            entry = {"hooks": [{"type": "command", "command": _hook_command(), "timeout": 5}]}
+            if event in _TOOL_EVENTS:
+                entry = {"matcher": "", **entry}
+            entries.append(entry)
+        if entries:
+            hooks[event] = entries
+        else:
+            hooks.pop(event, None)
+
+    if enabled:
+        script = _SCRIPT.format(socket=str(STATUS_HOOK_SOCKET))
+        if not HOOK_SCRIPT.exists() or HOOK_SCRIPT.read_text() != script:
+            HOOK_SCRIPT.parent.mkdir(parents=True, exist_ok=True)
+            HOOK_SCRIPT.write_text(script)
+    if json.dumps(hooks, sort_keys=True) == before:
+        return False
+
+    if hooks:
+        settings["hooks"] = hooks
+    else:
+        settings.pop("hooks", None)
+    CLAUDE_SETTINGS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CLAUDE_SETTINGS_FILE.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(settings, indent=2, ensure_ascii=False) + "\n")
+    os.replace(tmp, CLAUDE_SETTINGS_FILE)
+    logger.info(f"{'Installed' if enabled else 'Removed'} status hooks in {CLAUDE_SETTINGS_FILE}")
+    return True
+
+
+def _status_for(msg: dict) -> tuple[bool, Optional[str]]:
+    """Map one hook message to (known, status)."""
+    event = msg.get("event")
+    if event in _EVENT_STATUS:
+        return True, _EVENT_STATUS[event]
+    if event == "Notification":
+        # 只有权限确认需要用户介入；空闲提醒不改变状态
+        kind = msg.get("notification_type") or ""
+        if kind == "permission_prompt" or (not kind and "permission" in msg.get("message", "")):
+            return True, "waiting"
+    return False, None
+
+
+class _Receiver(asyncio.DatagramProtocol):
+    def datagram_received(self, data: bytes, addr):
+        try:
+            msg = json.loads(data)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return
+        if not isinstance(msg, dict) or not isinstance(msg.get("session_id"), str):
+            return
+        known, status = _status_for(msg)
+        if not known:
+            return
+        metrics.inc("claudecohub_status_hook_events_total", event=str(msg["event"]))
+        status_monitor.report(msg["session_id"], status)
+
+
+async def start():
+    global _transport
+    try:
+        install(STATUS_HOOKS)
+    except OSError as e:
+        logger.warning(f"Failed to update status hooks: {e}")
+    if not STATUS_HOOKS:
+        return
+    try:
+        STATUS_HOOK_SOCKET.parent.mkdir(parents=True, exist_ok=True)
+        STATUS_HOOK_SOCKET.unlink(missing_ok=True)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(str(STATUS_HOOK_SOCKET))
+        os.chmod(STATUS_HOOK_SOCKET, 0o600)
+        sock.setblocking(False)
+        loop = asyncio.get_running_loop()
+        _transport, _ = await loop.create_datagram_endpoint(_Receiver, sock=sock)
+    except OSError as e:
+        logger.warning(f"Status hook socket unavailable, probing panes only: {e}")
+
+
+async def stop():
+    global _transport
+    if _transport is not None:
+        _transport.close()
+        _transport = None
+        STATUS_HOOK_SOCKET.unlink(missing_ok=True)
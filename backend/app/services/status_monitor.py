@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Optional
+
+from ..config import STATUS_POLL_INTERVAL, WORKDIR_BASE
+from . import fs_watcher, tmux
+
+logger = logging.getLogger(__name__)
+
+# 每个订阅者队列的上限，积压超过后丢弃增量并改发全量快照
+_SUBSCRIBER_QUEUE_SIZE = 64
+
+# 钩子上报的状态在会话消失后保留多久（秒）
+_REPORT_TTL = 60.0
+# 上报的 working/waiting 持续这么久（秒）且窗格也这么久没有活动时，重新抓取窗格：
+# Esc 中断不会触发 Stop，拒绝授权后也没有新的事件，上报的状态会一直停在那里
+_REPORT_STALE = 30.0
+
+_snapshot: dict[str, str] = {}
+# session_id -> (钩子上报的状态, 上报时间)，有记录的会话不再抓取窗格
+_reported: dict[str, tuple[str, float]] = {}
+# 不在会话列表中但上报需一直保留的 session_id（预热池中尚未交付的会话）
+_kept: set[str] = set()
+# session_id -> 所属用户，由会话的起始目录得出；username -> 其会话 id
+_owners: dict[str, str] = {}
+_user_sessions: dict[str, set[str]] = {}
+# username -> 订阅队列，None 为管理员（接收所有会话）；queue -> username
+_subscribers: dict[Optional[str], set[asyncio.Queue]] = {}
+_queue_users: dict[asyncio.Queue, Optional[str]] = {}
+_task: Optional[asyncio.Task] = None
+
+
+def snapshot(username: Optional[str] = None) -> dict[str, str]:
+    """Return {session_id: status} for every alive tmux session, or only username's."""
+    if username is None:
+        return dict(_snapshot)
+    return {sid: _snapshot[sid] for sid in _user_sessions.get(username, ()) if sid in _snapshot}
+
+
+def owner(session_id: str) -> Optional[str]:
+    """The user whose workdir the session was started in, if known."""
+    return _owners.get(session_id)
+
+
+def _owner_of(path: str) -> Optional[str]:
+    try:
+        rel = Path(path).relative_to(WORKDIR_BASE)
+    except ValueError:
+        return None
+    return rel.parts[0] if rel.parts else None
+
+
+def _set_owner(session_id: str, username: Optional[str]):
+    old = _owners.get(session_id)
+    if old == username:
+        return
+    if old is not None:
+        _drop_owner(session_id)
+    if username is not None:
+        _owners[session_id] = username
+        _user_sessions.setdefault(username, set()).add(session_id)
+
+
+def _drop_owner(session_id: str):
+    username = _owners.pop(session_id, None)
+    if username is None:
+        return
+    sessions = _user_sessions.get(username)
+    if sessions is not None:
+        sessions.discard(session_id)
+        if not sessions:
+            del _user_sessions[username]
+
+
+def _send(q: asyncio.Queue, msg: dict):
+    try:
+        q.put_nowait(msg)
+    except asyncio.QueueFull:
+        while not q.empty():
+            q.get_nowait()
+        q.put_nowait({"type": "snapshot", "sessions": snapshot(_queue_users.get(q))})
+
+
+def _send_to(username: Optional[str], msg: dict):
+    for q in list(_subscribers.get(username, ())):
+        _send(q, msg)
+
+
+def _publish(changed: dict[str, str], removed: list[str]):
+    """Send each user only the changes of their own sessions; admins get all."""
+    if not changed and not removed:
+        return
+    _send_to(None, {"type": "diff", "changed": changed, "removed": removed})
+    per_user: dict[str, tuple[dict[str, str], list[str]]] = {}
+    for sid, st in changed.items():
+        username = _owners.get(sid)
+        if username is not None and username in _subscribers:
+            per_user.setdefault(username, ({}, []))[0][sid] = st
+    for sid in removed:
+        username = _owners.get(sid)
+        if username is not None and username in _subscribers:
+            per_user.setdefault(username, ({}, []))[1].append(sid)
+    for username, (c, r) in per_user.items():
+        _send_to(username, {"type": "diff", "changed": c, "removed": r})
+
+
+def apply_changes(changes: list[fs_watcher.Change]):
+    """fs_watcher subscriber: tell clients whose session list gained or lost a transcript."""
+    users = {
+        fs_watcher.username_for(c.path.parent)
+        for c in changes
+        if c.kind in ("created", "deleted") and c.path is not None and c.path.suffix == ".jsonl"
+    }
+    users.discard(None)
+    notify_sessions(users)
+
+
+def notify_sessions(users):
+    """Ask these users' dashboards to reload their session list."""
+    if not users:
+        return
+    _send_to(None, {"type": "sessions", "users": sorted(users)})
+    for username in users:
+        _send_to(username, {"type": "sessions", "users": [username]})
+
+
+def _apply(statuses: dict[str, str], owners: dict[str, Optional[str]]):
+    for sid, username in owners.items():
+        _set_owner(sid, username)
+    changed = {sid: st for sid, st in statuses.items() if _snapshot.get(sid) != st}
+    removed = [sid for sid in _snapshot if sid not in statuses]
+    _snapshot.clear()
+    _snapshot.update(statuses)
+    # 先按旧的归属发出 removed，再清掉归属
+    _publish(changed, removed)
+    for sid in removed:
+        _drop_owner(sid)
+
+
+def mark(session_id: str, status: Optional[str], username: Optional[str] = None):
+    """Record a known state change (create/resume/kill) without waiting for the next poll."""
+    if username is not None:
+        _set_owner(session_id, username)
+    if status is None:
+        if _snapshot.pop(session_id, None) is not None:
+            _publish({}, [session_id])
+        _drop_owner(session_id)
+    elif _snapshot.get(session_id) != status:
+        _snapshot[session_id] = status
+        _publish({session_id: status}, [])
+
+
+def report(session_id: str, status: Optional[str]):
+    """Record a state reported by the session's own hooks; None forgets it."""
+    if status is None:
+        _reported.pop(session_id, None)
+        return
+    _reported[session_id] = (status, time.monotonic())
+    if session_id in _snapshot:
+        mark(session_id, status)
+
+
+def keep_reports(session_id: str, keep: bool = True):
+    """Keep (or stop keeping) hook reports for a session that is not listed yet."""
+    if keep:
+        _kept.add(session_id)
+    else:
+        _kept.discard(session_id)
+
+
+def _trusted_report(session_id: str, last_activity: int, now: float, wall: float) -> Optional[str]:
+    """The hook-reported status, or None if there is none or it looks stale."""
+    reported = _reported.get(session_id)
+    if reported is None:
+        return None
+    status, at = reported
+    if status in ("working", "waiting") and now - at > _REPORT_STALE and wall - last_activity > _REPORT_STALE:
+        return None
+    return status
+
+
+async def refresh():
+    activity = await tmux.session_activity()
+    alive = list(activity)
+    now = time.monotonic()
+    wall = time.time()
+    statuses = {}
+    for sid, (last_activity, _, _) in activity.items():
+        status = _trusted_report(sid, last_activity, now, wall)
+        if status is not None:
+            statuses[sid] = status
+    # 没有钩子上报的会话（钩子安装前启动的等）或上报已过时的，退回抓取窗格文字
+    rest = [sid for sid in alive if sid not in statuses]
+    if rest:
+        statuses.update(await tmux.detect_statuses(rest))
+    alive_set = set(alive)
+    for sid, (_, at) in list(_reported.items()):
+        if sid not in alive_set and sid not in _kept and now - at > _REPORT_TTL:
+            del _reported[sid]
+    _apply(statuses, {sid: _owner_of(path) for sid, (_, _, path) in activity.items()})
+
+
+async def _poll_loop():
+    while True:
+        await asyncio.sleep(STATUS_POLL_INTERVAL)
+        try:
+            await refresh()
+        except Exception as e:
+            logger.warning(f"Status refresh failed: {e}")
+
+
+def subscribe(username: Optional[str]) -> asyncio.Queue:
+    """Queue of status messages for username's sessions; None receives every session."""
+    q: asyncio.Queue = asyncio.Queue(maxsize=_SUBSCRIBER_QUEUE_SIZE)
+    q.put_nowait({"type": "snapshot", "sessions": snapshot(username)})
+    _subscribers.setdefault(username, set()).add(q)
+    _queue_users[q] = username
+    return q
+
+
+def unsubscribe(q: asyncio.Queue):
+    if q not in _queue_users:
+        return
+    username = _queue_users.pop(q)
+    queues = _subscribers.get(username)
+    if queues is not None:
+        queues.discard(q)
+        if not queues:
+            del _subscribers[username]
+
+
+def stats() -> dict:
+    return {
+        "subscribers": len(_queue_users),
+        "queue_max": max((q.qsize() for q in _queue_users), default=0),
+        "reported": len(_reported),
+    }
+
+
+async def start():
+    global _task
+    try:
+        await refresh()
+    except Exception as e:
+        logger.warning(f"Initial status refresh failed: {e}")
+    _task = asyncio.create_task(_poll_loop())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
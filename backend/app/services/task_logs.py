@@ -0,0 +1,305 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from ..config import (
+    SCHEDULES_DIR,
+    TASK_LOG_MAX_AGE_DAYS,
+    TASK_LOG_MAX_RUN_BYTES,
+    TASK_LOG_KEEP_BYTES,
+    TASK_LOG_COMPRESS_MIN_BYTES,
+)
+
+logger = logging.getLogger(__name__)
+
+TASK_LOG_DIR = SCHEDULES_DIR / "task_logs"
+INDEX_FILE = TASK_LOG_DIR / "index.jsonl"
+
+_SAFE_RE = re.compile(r"[^A-Za-z0-9._-]+")
+
+# run_id -> record；index.jsonl 只追加，同一 run_id 以最后一条为准
+_runs: dict[str, dict] = {}
+_loaded = False
+# 运行中任务的输出事件，供 tail 等待新数据
+_live: dict[str, asyncio.Event] = {}
+# 追加与整体重写 index.jsonl 互斥，否则重写期间追加的记录会被覆盖掉
+_index_lock = threading.Lock()
+# 日志与索引的写入都在这一个线程里按提交顺序执行，不占用事件循环
+_io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-logs")
+# index.jsonl 当前的行数；超过存活记录数的两倍（且不少于下限）时才整体压缩
+_index_lines = 0
+_COMPACT_MIN_LINES = 1000
+# 输出先在内存中攒着，满这么多字节或过了这么久（秒）再写盘
+_FLUSH_BYTES = 64 * 1024
+_FLUSH_DELAY = 0.2
+
+
+def _safe(name: str) -> str:
+    return _SAFE_RE.sub("_", name) or "_"
+
+
+def _load_index():
+    global _loaded, _index_lines
+    if _loaded:
+        return
+    _loaded = True
+    if not INDEX_FILE.exists():
+        return
+    with open(INDEX_FILE, encoding="utf-8") as f:
+        for line in f:
+            _index_lines += 1
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(rec, dict) or "run_id" not in rec:
+                continue
+            if rec.get("removed"):
+                # 轮转删掉的运行记录
+                _runs.pop(rec["run_id"], None)
+            else:
+                _runs[rec["run_id"]] = rec
+    # 上次进程退出时仍在运行的任务不会再有结束记录
+    for rec in _runs.values():
+        if rec.get("finished_at") is None:
+            rec["finished_at"] = rec["started_at"]
+            rec["interrupted"] = True
+
+
+def _log_failure(what: str):
+    def callback(fut: Future):
+        if not fut.cancelled() and fut.exception() is not None:
+            logger.warning(f"Task log {what} failed: {fut.exception()}")
+    return callback
+
+
+def _write_index_lines(lines: list[str]):
+    with _index_lock:
+        TASK_LOG_DIR.mkdir(parents=True, exist_ok=True)
+        with open(INDEX_FILE, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+
+
+def _append_index(*recs: dict):
+    """Queue records for appending to index.jsonl; the last one per run_id wins."""
+    global _index_lines
+    _index_lines += len(recs)
+    lines = [json.dumps(rec, ensure_ascii=False) + "\n" for rec in recs]
+    _io_pool.submit(_write_index_lines, lines).add_done_callback(_log_failure("index append"))
+
+
+class RunLog:
+    """Chunked writer for one run's output, registered in the run index."""
+
+    def __init__(self, task: str, username: str, workdir: str, prompt: str,
+                 session_id: str = ""):
+        _load_index()
+        started = datetime.now()
+        self.run_id = f"{started.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.path = TASK_LOG_DIR / _safe(username or "_") / _safe(task) / f"{self.run_id}.log"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = open(self.path, "wb")
+        header = f"[{started.isoformat()}] Task: {task}\nPrompt: {prompt}\n{'=' * 60}\n"
+        self._f.write(header.encode())
+        self.bytes = self._f.tell()
+        self.truncated = False
+        self._buf = bytearray()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.record = {
+            "run_id": self.run_id,
+            "task": task,
+            "user": username,
+            "workdir": workdir,
+            "session_id": session_id,
+            "started_at": started.isoformat(),
+            "finished_at": None,
+            "exit_code": None,
+            "output_offset": self.bytes,
+            "bytes": self.bytes,
+            "path": str(self.path.relative_to(TASK_LOG_DIR)),
+        }
+        _runs[self.run_id] = self.record
+        _append_index(self.record)
+        _live[self.run_id] = asyncio.Event()
+
+    def write(self, data: bytes):
+        if self.truncated:
+            return
+        room = TASK_LOG_MAX_RUN_BYTES - self.bytes
+        if len(data) > room:
+            data = data[:max(room, 0)] + b"\n[output truncated]\n"
+            self.truncated = True
+        self._buf += data
+        self.bytes += len(data)
+        self.record["bytes"] = self.bytes
+        if len(self._buf) >= _FLUSH_BYTES:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(_FLUSH_DELAY, self._flush)
+
+    def _write_out(self, data: bytes):
+        self._f.write(data)
+        self._f.flush()
+
+    def _flush(self):
+        """Hand the buffered output to the I/O thread; tail readers wake once it is on disk."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._buf:
+            return
+        data = bytes(self._buf)
+        self._buf.clear()
+        fut = _io_pool.submit(self._write_out, data)
+        fut.add_done_callback(_log_failure("write"))
+        loop = asyncio.get_running_loop()
+        fut.add_done_callback(lambda _: loop.call_soon_threadsafe(self._notify))
+
+    def _notify(self):
+        event = _live.get(self.run_id)
+        if event is not None:
+            event.set()
+
+    async def finish(self, exit_code: Optional[int]):
+        self._flush()
+        # 同一线程按顺序执行，关闭前排队的写入都已完成
+        await asyncio.get_running_loop().run_in_executor(_io_pool, self._f.close)
+        self.record.update(
+            finished_at=datetime.now().isoformat(),
+            exit_code=exit_code,
+            truncated=self.truncated,
+        )
+        _append_index(self.record)
+        event = _live.pop(self.run_id, None)
+        if event is not None:
+            event.set()
+        try:
+            await _rotate(self.record)
+        except OSError as e:
+            logger.warning(f"Task log rotation failed: {e}")
+
+
+def _compress_file(src: Path) -> Path:
+    dst = src.with_suffix(".log.gz")
+    with open(src, "rb") as fin, gzip.open(dst, "wb") as fout:
+        shutil.copyfileobj(fin, fout)
+    src.unlink()
+    return dst
+
+
+def _remove_files(paths: list[Path]):
+    for path in paths:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _compact_index():
+    with _index_lock:
+        # 在锁内取快照，拿锁之前已追加的记录都已在 _runs 中
+        records = [dict(r) for r in list(_runs.values())]
+        TASK_LOG_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = INDEX_FILE.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        os.replace(tmp, INDEX_FILE)
+
+
+async def _rotate(finished: dict):
+    """Compress a finished run, then apply the age and per-task size limits.
+
+    File work runs in executors; the in-memory index is only touched on the
+    event loop. index.jsonl is appended to and only compacted once it holds
+    about twice as many lines as there are live runs.
+    """
+    global _index_lines
+    loop = asyncio.get_running_loop()
+    if finished["bytes"] >= TASK_LOG_COMPRESS_MIN_BYTES:
+        dst = await loop.run_in_executor(None, _compress_file, TASK_LOG_DIR / finished["path"])
+        finished["path"] = str(dst.relative_to(TASK_LOG_DIR))
+        finished["compressed"] = True
+
+    cutoff = (datetime.now() - timedelta(days=TASK_LOG_MAX_AGE_DAYS)).isoformat()
+    same_task = sorted(
+        (r for r in _runs.values()
+         if r["workdir"] == finished["workdir"] and r["task"] == finished["task"]
+         and r.get("finished_at")),
+        key=lambda r: r["started_at"], reverse=True,
+    )
+    kept = 0
+    removed = []
+    for rec in same_task:
+        kept += rec["bytes"]
+        if rec is not finished and (rec["started_at"] < cutoff or kept > TASK_LOG_KEEP_BYTES):
+            removed.append(rec)
+    for rec in removed:
+        _runs.pop(rec["run_id"], None)
+    if removed:
+        await loop.run_in_executor(None, _remove_files, [TASK_LOG_DIR / r["path"] for r in removed])
+    # 压缩后的新路径与删除标记追加到索引末尾，行数过多时才整体重写
+    updates = [{"run_id": r["run_id"], "removed": True} for r in removed]
+    if finished.get("compressed"):
+        updates.append(finished)
+    if updates:
+        _append_index(*updates)
+    if _index_lines > max(_COMPACT_MIN_LINES, 2 * len(_runs)):
+        _index_lines = len(_runs)
+        await loop.run_in_executor(_io_pool, _compact_index)
+
+
+def list_runs(workdir: str, task: Optional[str] = None) -> list[dict]:
+    _load_index()
+    runs = [
+        r for r in _runs.values()
+        if r["workdir"] == workdir and (task is None or r["task"] == task)
+    ]
+    runs.sort(key=lambda r: r["started_at"], reverse=True)
+    return runs
+
+
+def get_run(run_id: str) -> Optional[dict]:
+    _load_index()
+    return _runs.get(run_id)
+
+
+def read_range(rec: dict, offset: int, length: int) -> bytes:
+    """Read [offset, offset+length) of a run's log without loading the whole file."""
+    path = TASK_LOG_DIR / rec["path"]
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+async def follow(rec: dict, offset: int, chunk: int = 65536) -> AsyncIterator[bytes]:
+    """Yield a run's log from offset, waiting for new output until the run ends."""
+    loop = asyncio.get_running_loop()
+    while True:
+        event = _live.get(rec["run_id"])
+        if event is not None:
+            event.clear()
+        try:
+            data = await loop.run_in_executor(None, read_range, rec, offset, chunk)
+        except FileNotFoundError:
+            # 读取时恰好被压缩替换，按新路径重读
+            await asyncio.sleep(0.1)
+            continue
+        if data:
+            offset += len(data)
+            yield data
+            continue
+        if event is None:
+            return
+        await event.wait()
@@ -0,0 +1,177 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from ..config import (
+    TASK_MAX_CONCURRENCY,
+    TASK_MAX_PER_USER,
+    TASK_JITTER,
+    TASK_MISFIRE_GRACE,
+)
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(order=True)
+class _QueuedTask:
+    sort_key: tuple
+    key: str = field(compare=False)
+    username: str = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    ready_at: float = field(compare=False)
+    run: Callable[[], Awaitable] = field(compare=False)
+
+
+class TaskRunner:
+    """Priority queue in front of scheduled `claude -p` runs.
+
+    Fires are delayed by a random jitter so jobs on the same cron minute are
+    spread out, then dispatched highest priority first within a global and a
+    per-user concurrency cap. A task that is already waiting in the queue is
+    coalesced rather than queued twice, and one that has waited longer than
+    TASK_MISFIRE_GRACE is dropped as a misfire.
+    """
+
+    def __init__(self, max_concurrency: int, max_per_user: int,
+                 jitter: float, misfire_grace: float):
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.jitter = jitter
+        self.misfire_grace = misfire_grace
+        self._heap: list[_QueuedTask] = []
+        self._queued_keys: set[str] = set()
+        self._running: dict[str, int] = {}
+        self._running_total = 0
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        # 运行中的任务；事件循环只持有弱引用，不留引用可能在运行中被回收
+        self._executing: set[asyncio.Task] = set()
+        self._counters = {
+            "submitted": 0, "coalesced": 0, "misfired": 0,
+            "completed": 0, "failed": 0,
+        }
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def submit(self, key: str, username: str, run: Callable[[], Awaitable],
+               priority: int = 0) -> bool:
+        """Queue run() under key; returns False if key was already waiting."""
+        self._counters["submitted"] += 1
+        if key in self._queued_keys:
+            self._counters["coalesced"] += 1
+            return False
+        now = time.monotonic()
+        ready_at = now + random.uniform(0, self.jitter)
+        item = _QueuedTask(
+            sort_key=(-priority, ready_at, next(self._seq)),
+            key=key, username=username, enqueued_at=now, ready_at=ready_at, run=run,
+        )
+        heapq.heappush(self._heap, item)
+        self._queued_keys.add(key)
+        self._wakeup.set()
+        return True
+
+    def _expire(self, now: float):
+        expired = [i for i in self._heap if now - i.ready_at > self.misfire_grace]
+        for item in expired:
+            self._queued_keys.discard(item.key)
+            self._counters["misfired"] += 1
+            logger.warning(f"Task {item.key} misfired after waiting {now - item.enqueued_at:.0f}s")
+        if expired:
+            self._heap = [i for i in self._heap if now - i.ready_at <= self.misfire_grace]
+            heapq.heapify(self._heap)
+
+    async def _dispatch_loop(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            self._expire(now)
+            # 逐个弹出堆顶；未到时间或用户已满额的先放到一边，结束后再放回
+            skipped = []
+            next_ready = None
+            while self._heap and self._running_total < self.max_concurrency:
+                item = heapq.heappop(self._heap)
+                if item.ready_at > now:
+                    next_ready = item.ready_at if next_ready is None else min(next_ready, item.ready_at)
+                    skipped.append(item)
+                elif self._running.get(item.username, 0) >= self.max_per_user:
+                    skipped.append(item)
+                else:
+                    self._queued_keys.discard(item.key)
+                    self._start(item, now)
+            for item in skipped:
+                heapq.heappush(self._heap, item)
+            timeout = next_ready - now if next_ready is not None else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start(self, item: _QueuedTask, now: float):
+        waited = now - item.ready_at
+        self._wait_count += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        metrics.observe("claudecohub_task_wait_seconds", waited)
+        self._running[item.username] = self._running.get(item.username, 0) + 1
+        self._running_total += 1
+        task = asyncio.create_task(self._execute(item))
+        self._executing.add(task)
+        task.add_done_callback(self._executing.discard)
+
+    async def _execute(self, item: _QueuedTask):
+        started = time.monotonic()
+        result = "failed"
+        try:
+            await item.run()
+            self._counters["completed"] += 1
+            result = "completed"
+        except Exception as e:
+            self._counters["failed"] += 1
+            logger.error(f"Task {item.key} failed: {e}")
+        finally:
+            metrics.observe("claudecohub_task_duration_seconds", time.monotonic() - started, result=result)
+            self._running[item.username] -= 1
+            if not self._running[item.username]:
+                del self._running[item.username]
+            self._running_total -= 1
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._heap),
+            "running": self._running_total,
+            "running_per_user": dict(self._running),
+            "max_concurrency": self.max_concurrency,
+            "max_per_user": self.max_per_user,
+            "wait_seconds_avg": self._wait_total / self._wait_count if self._wait_count else 0.0,
+            "wait_seconds_max": self._wait_max,
+            **self._counters,
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in self._executing:
+            task.cancel()
+        await asyncio.gather(*self._executing, return_exceptions=True)
+
+
+runner = TaskRunner(TASK_MAX_CONCURRENCY, TASK_MAX_PER_USER, TASK_JITTER, TASK_MISFIRE_GRACE)
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Optional
+
+from ..config import TERMINAL_HIGH_WATER
+from . import metrics, pane_snapshot, pty_lifecycle, tmux
+from .pty_bridge import PtyBridge
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """One viewer of a shared terminal, with its own bounded frame queue."""
+
+    def __init__(self, hub: "TerminalHub", readonly: bool):
+        self.hub = hub
+        self.readonly = readonly
+        self.pending = 0
+        self._frames: deque[bytes] = deque()
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def push(self, frame: bytes):
+        if self._closed:
+            return
+        if self.pending > 2 * TERMINAL_HIGH_WATER:
+            # 该观看者跟不上：丢弃积压，待其追上后整屏重绘
+            self._frames.clear()
+            self.pending = 0
+            self.hub.request_redraw()
+            return
+        self._frames.append(frame)
+        self.pending += len(frame)
+        self._ready.set()
+
+    async def get(self) -> bytes:
+        """Return the next frame, or b"" once the terminal has gone away."""
+        while not self._frames:
+            if self._closed:
+                return b""
+            self._ready.clear()
+            await self._ready.wait()
+        frame = self._frames.popleft()
+        self.pending -= len(frame)
+        self.hub.on_drain()
+        return frame
+
+    def write(self, data: bytes):
+        if not self.readonly:
+            self.hub.bridge.write(data)
+
+    def resize(self, rows: int, cols: int):
+        # 共享客户端只有一个尺寸，由最后调整大小的可写观看者决定
+        if not self.readonly:
+            self.hub.bridge.resize(rows, cols)
+
+    def close(self):
+        self._closed = True
+        self._ready.set()
+
+
+class TerminalHub:
+    """A single tmux attach client for a session, fanned out to every subscriber."""
+
+    def __init__(self, session_id: str, bridge: PtyBridge):
+        self.session_id = session_id
+        self.bridge = bridge
+        self.subscribers: set[Subscriber] = set()
+        self._drained = asyncio.Event()
+        self._redraw: Optional[asyncio.Task] = None
+        self._pump_task = asyncio.create_task(self._pump())
+
+    async def _pump(self):
+        try:
+            while True:
+                # 所有观看者都积压超过高水位时才停止读取，由 PTY 流控让 tmux 降速
+                while self.subscribers and min(
+                    s.pending for s in self.subscribers
+                ) >= TERMINAL_HIGH_WATER:
+                    self._drained.clear()
+                    await self._drained.wait()
+                frame = await self.bridge.read_frame()
+                if not frame:
+                    break
+                pane_snapshot.invalidate(self.session_id)
+                metrics.inc("claudecohub_pty_frames_total")
+                metrics.inc("claudecohub_pty_bytes_total", len(frame))
+                for sub in list(self.subscribers):
+                    sub.push(frame)
+        except Exception as e:
+            logger.debug(f"hub pump for {self.session_id} ended: {e}")
+        finally:
+            for sub in list(self.subscribers):
+                sub.close()
+
+    @property
+    def finished(self) -> bool:
+        return self._pump_task.done()
+
+    def on_drain(self):
+        self._drained.set()
+
+    def request_redraw(self):
+        if self._redraw is None or self._redraw.done():
+            self._redraw = asyncio.create_task(tmux.refresh_client(self.bridge.tty))
+
+    async def close(self):
+        self._pump_task.cancel()
+        await pty_lifecycle.terminate(self.bridge)
+        logger.debug(
+            f"terminal {self.session_id}: {self.bridge.bytes_read} bytes, "
+            f"{self.bridge.reads} reads, {self.bridge.frames} frames"
+        )
+
+
+_hubs: dict[str, TerminalHub] = {}
+
+
+def join(session_id: str, readonly: bool = False) -> Subscriber:
+    """Subscribe to a session's terminal, attaching a shared tmux client if needed.
+
+    A late joiner triggers a redraw of the shared client, which doubles as
+    its initial screen snapshot.
+    """
+    hub = _hubs.get(session_id)
+    if hub is not None and hub.finished:
+        # tmux 会话已退出，剩余观看者离开时会关闭旧的 hub
+        hub = None
+    if hub is None:
+        bridge = PtyBridge.spawn(
+            ["tmux", "attach-session", "-t", session_id], env=pty_lifecycle.child_env()
+        )
+        hub = _hubs[session_id] = TerminalHub(session_id, bridge)
+        sub = Subscriber(hub, readonly)
+        hub.subscribers.add(sub)
+    else:
+        sub = Subscriber(hub, readonly)
+        hub.subscribers.add(sub)
+        hub.request_redraw()
+    return sub
+
+
+async def leave(sub: Subscriber):
+    """Drop a subscriber; the shared client is detached after the last one leaves."""
+    sub.close()
+    hub = sub.hub
+    hub.subscribers.discard(sub)
+    hub.on_drain()
+    if not hub.subscribers:
+        if _hubs.get(hub.session_id) is hub:
+            del _hubs[hub.session_id]
+        await hub.close()
+
+
+def viewer_count(session_id: str) -> int:
+    hub = _hubs.get(session_id)
+    return len(hub.subscribers) if hub else 0
+
+
+async def close_all():
+    hubs = list(_hubs.values())
+    _hubs.clear()
+    for hub in hubs:
+        for sub in list(hub.subscribers):
+            sub.close()
+        hub.subscribers.clear()
+    await asyncio.gather(*(hub.close() for hub in hubs), return_exceptions=True)
+
+
+def stats() -> dict:
+    """Shared terminals, their viewers and the largest per-viewer backlog."""
+    subs = [sub for hub in _hubs.values() for sub in hub.subscribers]
+    return {
+        "terminals": len(_hubs),
+        "viewers": len(subs),
+        "pending_bytes_max": max((sub.pending for sub in subs), default=0),
+        "pending_frames_max": max((len(sub._frames) for sub in subs), default=0),
+    }
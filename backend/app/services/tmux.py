@@ -1,68 +1,431 @@
 import asyncio
-import re
-from typing import Optional
+import logging
+import shlex
+import time
+from typing import Iterable, Optional
 
+from ..config import TMUX_CONTROL_MODE, TMUX_MAX_CONCURRENCY
 
-async def _run(cmd: str) -> tuple[int, str]:
-    proc = await asyncio.create_subprocess_shell(
-        cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+logger = logging.getLogger(__name__)
+
+# 本服务内部使用的会话名前缀，这类会话不出现在会话列表中
+INTERNAL_PREFIX = "_claudecohub_"
+# 控制模式客户端挂靠的隐藏会话
+CONTROL_SESSION = INTERNAL_PREFIX + "ctl"
+# 批量执行时用于切分各命令输出的标记行（仅 exec 回退路径使用）
+_MARKER = "::claudecohub-cmd::"
+# 单次 tmux 调用中最多探测的会话数，避免命令行过长
+_PROBE_BATCH = 64
+# 控制连接断开后，再次尝试连接前的等待时间（秒）
+_RECONNECT_DELAY = 30.0
+
+_exec_slots = asyncio.Semaphore(TMUX_MAX_CONCURRENCY)
+_metrics: dict[str, dict] = {}
+
+
+def _record(name: str, transport: str, rc: int, elapsed: float):
+    m = _metrics.setdefault(
+        name, {"count": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+               "control": 0, "exec": 0}
     )
-    stdout, _ = await proc.communicate()
-    return proc.returncode, stdout.decode(errors="replace").strip()
+    m["count"] += 1
+    m[transport] += 1
+    if rc != 0:
+        m["errors"] += 1
+    m["total_seconds"] += elapsed
+    m["max_seconds"] = max(m["max_seconds"], elapsed)
+
+
+def metrics() -> dict[str, dict]:
+    """Per-command invocation counts and latency, split by transport."""
+    return {name: dict(m) for name, m in _metrics.items()}
+
+
+def _quote(args: list[str]) -> str:
+    """Render argv as one line of tmux command syntax."""
+    return " ".join("'" + a.replace("'", "'\\''") + "'" for a in args)
+
+
+class _ControlClient:
+    """A long-lived `tmux -C` client; commands are pipelined over its stdin.
+
+    Each command line is answered by one %begin/%end (or %error) block, in
+    order, so responses are matched to requests FIFO.
+    """
+
+    def __init__(self, proc: asyncio.subprocess.Process):
+        self.proc = proc
+        self._pending: list[asyncio.Future] = []
+        self._ready = asyncio.get_running_loop().create_future()
+        self._reader = asyncio.create_task(self._read_loop())
+
+    @classmethod
+    async def connect(cls) -> "_ControlClient":
+        proc = await asyncio.create_subprocess_exec(
+            "tmux", "-C", "new-session", "-A", "-s", CONTROL_SESSION,
+            "tail -f /dev/null",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        client = cls(proc)
+        await asyncio.wait_for(asyncio.shield(client._ready), 5)
+        return client
+
+    @property
+    def alive(self) -> bool:
+        return not self._reader.done()
+
+    async def _read_loop(self):
+        block: Optional[str] = None
+        lines: list[str] = []
+        try:
+            while True:
+                raw = await self.proc.stdout.readline()
+                if not raw:
+                    break
+                line = raw.decode(errors="replace").rstrip("\n")
+                if block is None:
+                    if line.startswith("%begin "):
+                        block = line.split(" ")[2]
+                        lines = []
+                    # 其余 % 开头的行为异步通知，忽略
+                    continue
+                tag, _, rest = line.partition(" ")
+                if tag in ("%end", "%error") and rest.split(" ")[1:2] == [block]:
+                    rc = 0 if tag == "%end" else 1
+                    block = None
+                    if not self._ready.done():
+                        # 第一个应答块属于 new-session 本身
+                        self._ready.set_result(None)
+                    elif self._pending:
+                        fut = self._pending.pop(0)
+                        if not fut.done():
+                            fut.set_result((rc, "\n".join(lines)))
+                    continue
+                lines.append(line)
+        except Exception as e:
+            logger.debug(f"tmux control client read failed: {e}")
+        finally:
+            err = ConnectionError("tmux control client closed")
+            if not self._ready.done():
+                self._ready.set_exception(err)
+            for fut in self._pending:
+                if not fut.done():
+                    fut.set_exception(err)
+            self._pending.clear()
+
+    async def run_many(self, commands: list[list[str]]) -> list[tuple[int, str]]:
+        if not self.alive:
+            raise ConnectionError("tmux control client closed")
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in commands]
+        self._pending.extend(futures)
+        self.proc.stdin.write("".join(_quote(c) + "\n" for c in commands).encode())
+        await self.proc.stdin.drain()
+        return list(await asyncio.gather(*futures))
+
+    async def close(self):
+        try:
+            self.proc.stdin.close()
+        except Exception:
+            pass
+        try:
+            await asyncio.wait_for(self.proc.wait(), 2)
+        except asyncio.TimeoutError:
+            self.proc.kill()
+        self._reader.cancel()
+
+
+_control: Optional[_ControlClient] = None
+_control_retry_at = 0.0
+_control_lock = asyncio.Lock()
+
+
+async def _get_control() -> Optional[_ControlClient]:
+    global _control, _control_retry_at
+    if not TMUX_CONTROL_MODE:
+        return None
+    if _control is not None and _control.alive:
+        return _control
+    if time.monotonic() < _control_retry_at:
+        return None
+    async with _control_lock:
+        if _control is not None and _control.alive:
+            return _control
+        try:
+            _control = await _ControlClient.connect()
+            logger.info("tmux control-mode client connected")
+        except Exception as e:
+            logger.info(f"tmux control mode unavailable, using exec: {e}")
+            _control = None
+            _control_retry_at = time.monotonic() + _RECONNECT_DELAY
+    return _control
+
+
+async def _exec(args: list[str]) -> tuple[int, str]:
+    async with _exec_slots:
+        proc = await asyncio.create_subprocess_exec(
+            "tmux", *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        stdout, _ = await proc.communicate()
+    # 只去掉 tmux 输出的最后一个换行：capture-pane 的行首空白和末尾空行决定了画面位置
+    out = stdout.decode(errors="replace")
+    return proc.returncode, out[:-1] if out.endswith("\n") else out
+
+
+async def _exec_many(commands: list[list[str]]) -> list[tuple[int, str]]:
+    """Run several commands in one tmux process, splitting output on marker lines."""
+    argv: list[str] = []
+    for i, cmd in enumerate(commands):
+        if argv:
+            argv.append(";")
+        argv += ["display-message", "-p", f"{_MARKER}{i}", ";", *cmd]
+    rc, out = await _exec(argv)
+    outputs = [[] for _ in commands]
+    current = -1
+    # 用 split 而非 splitlines，保留各段输出末尾的空行
+    for line in out.split("\n"):
+        if line.startswith(_MARKER) and line[len(_MARKER):].isdigit():
+            current = int(line[len(_MARKER):])
+        elif current >= 0:
+            outputs[current].append(line)
+    results = [(0, "\n".join(lines)) for lines in outputs]
+    if rc != 0:
+        # 链中某条命令失败后 tmux 会中止其余命令：最后一个标记对应失败的命令，
+        # 之后的命令尚未执行，逐条补跑
+        if current >= 0:
+            results[current] = (rc, results[current][1])
+        for i in range(current + 1, len(commands)):
+            results[i] = await _exec(commands[i])
+    return results
+
+
+async def _run_many(commands: list[list[str]]) -> list[tuple[int, str]]:
+    """Run tmux commands in one round-trip; returns (rc, output) per command.
+
+    Goes over the control-mode connection when one is available, and falls
+    back to a single argv exec (no shell) otherwise.
+    """
+    if not commands:
+        return []
+    start = time.monotonic()
+    results = None
+    transport = "control"
+    control = await _get_control()
+    if control is not None:
+        try:
+            results = await control.run_many(commands)
+        except (ConnectionError, OSError) as e:
+            logger.debug(f"tmux control command failed, falling back to exec: {e}")
+    if results is None:
+        transport = "exec"
+        if len(commands) == 1:
+            results = [await _exec(commands[0])]
+        else:
+            results = await _exec_many(commands)
+    elapsed = time.monotonic() - start
+    for cmd, (rc, _) in zip(commands, results):
+        _record(cmd[0], transport, rc, elapsed / len(commands))
+    return results
+
+
+async def _run(*args: str) -> tuple[int, str]:
+    return (await _run_many([list(args)]))[0]
+
+
+async def start():
+    await _get_control()
 
 
-async def list_tmux_sessions() -> list[str]:
-    rc, out = await _run('tmux list-sessions -F "#{session_name}" 2>/dev/null')
+async def stop():
+    global _control
+    if _control is not None:
+        # 隐藏会话里的 tail 会让 tmux 服务器在退出后一直存活，先结束它
+        await _exec(["kill-session", "-t", f"={CONTROL_SESSION}"])
+        await _control.close()
+        _control = None
+
+
+async def list_tmux_sessions(include_internal: bool = False) -> list[str]:
+    rc, out = await _run("list-sessions", "-F", "#{session_name}")
     if rc != 0 or not out:
         return []
-    return [line.strip().strip('"') for line in out.splitlines() if line.strip()]
+    return [
+        line.strip() for line in out.splitlines()
+        if line.strip() and (include_internal or not line.strip().startswith(INTERNAL_PREFIX))
+    ]
 
 
 async def session_exists(session_id: str) -> bool:
-    sessions = await list_tmux_sessions()
-    return session_id in sessions
+    if session_id == CONTROL_SESSION:
+        return False
+    rc, _ = await _run("has-session", "-t", f"={session_id}")
+    return rc == 0
 
 
-async def create_session(session_id: str, workdir: str) -> bool:
-    rc, _ = await _run(
-        f"tmux new-session -d -s {session_id} -c {workdir} "
-        f"'claude --session-id {session_id}'"
-    )
-    if rc == 0:
-        await _run(f"tmux set-option -t {session_id} mouse on")
+async def _start_session(session_id: str, workdir: str, command: str) -> bool:
+    (rc, _), _ = await _run_many([
+        ["new-session", "-d", "-s", session_id, "-c", workdir, command],
+        ["set-option", "-t", f"={session_id}:", "mouse", "on"],
+    ])
     return rc == 0
 
 
+async def create_session(session_id: str, workdir: str, name: Optional[str] = None) -> bool:
+    """Start claude for session_id; the tmux session is called name if given."""
+    return await _start_session(
+        name or session_id, workdir, f"claude --session-id {shlex.quote(session_id)}"
+    )
+
+
 async def resume_session(session_id: str, workdir: str) -> bool:
-    rc, _ = await _run(
-        f"tmux new-session -d -s {session_id} -c {workdir} "
-        f"'claude --resume {session_id}'"
+    return await _start_session(
+        session_id, workdir, f"claude --resume {shlex.quote(session_id)}"
     )
-    if rc == 0:
-        await _run(f"tmux set-option -t {session_id} mouse on")
+
+
+async def rename_session(old: str, new: str) -> bool:
+    rc, _ = await _run("rename-session", "-t", f"={old}", new)
     return rc == 0
 
 
 async def kill_session(session_id: str) -> bool:
-    rc, _ = await _run(f"tmux kill-session -t {session_id}")
+    rc, _ = await _run("kill-session", "-t", f"={session_id}")
     return rc == 0
 
 
-async def capture_last_lines(session_id: str, n: int = 5) -> str:
-    rc, out = await _run(f"tmux capture-pane -t {session_id} -p -S -{n}")
-    if rc != 0:
-        return ""
-    return out
+async def refresh_client(client_tty: str) -> bool:
+    """Force a full redraw of the attached client on client_tty."""
+    rc, _ = await _run("refresh-client", "-t", client_tty)
+    return rc == 0
 
 
-async def detect_status(session_id: str) -> Optional[str]:
-    """Return 'working', 'idle+bg', 'idle', or None if session doesn't exist."""
-    if not await session_exists(session_id):
-        return None
-    lines = await capture_last_lines(session_id, 5)
+async def detach_client(client_tty: str) -> bool:
+    rc, _ = await _run("detach-client", "-t", client_tty)
+    return rc == 0
+
+
+async def list_clients() -> list[tuple[int, str]]:
+    """Return (pid, tty) for every client attached to the tmux server."""
+    rc, out = await _run("list-clients", "-F", "#{client_pid} #{client_tty}")
+    if rc != 0 or not out:
+        return []
+    clients = []
+    for line in out.splitlines():
+        pid, _, tty = line.strip().partition(" ")
+        if pid.isdigit() and tty:
+            clients.append((int(pid), tty))
+    return clients
+
+
+async def pane_states() -> dict[str, tuple[int, ...]]:
+    """Return {session_id: (activity, history, cursor_x, cursor_y, width, height)}.
+
+    Describes each session's active pane in one round-trip; any output in the
+    pane changes the tuple, so it doubles as a cheap change marker.
+    """
+    rc, out = await _run(
+        "list-sessions", "-F",
+        "#{session_name}\t#{window_activity}\t#{history_size}"
+        "\t#{cursor_x}\t#{cursor_y}\t#{pane_width}\t#{pane_height}",
+    )
+    if rc != 0 or not out:
+        return {}
+    states = {}
+    for line in out.splitlines():
+        name, _, rest = line.partition("\t")
+        fields = rest.split("\t")
+        if name.startswith(INTERNAL_PREFIX) or len(fields) != 6 or not all(f.isdigit() for f in fields):
+            continue
+        states[name] = tuple(int(f) for f in fields)
+    return states
+
+
+async def session_activity() -> dict[str, tuple[int, int, str]]:
+    """Return {session_id: (last_activity, attached_clients, start_directory)}.
+
+    last_activity is the later of the last client input and the last pane
+    output, in epoch seconds.
+    """
+    rc, out = await _run(
+        "list-sessions", "-F",
+        "#{session_name}\t#{session_activity}\t#{window_activity}"
+        "\t#{session_attached}\t#{session_path}",
+    )
+    if rc != 0 or not out:
+        return {}
+    sessions = {}
+    for line in out.splitlines():
+        fields = line.split("\t", 4)
+        if len(fields) != 5 or fields[0].startswith(INTERNAL_PREFIX):
+            continue
+        name, input_at, output_at, attached, path = fields
+        if not (input_at.isdigit() and output_at.isdigit() and attached.isdigit()):
+            continue
+        sessions[name] = (max(int(input_at), int(output_at)), int(attached), path)
+    return sessions
+
+
+async def capture_panes(
+    session_ids: list[str], scrollback: int = 0, escapes: bool = False
+) -> dict[str, str]:
+    """Capture the active pane of each session, plus `scrollback` lines of history.
+
+    With escapes=True colours and attributes are kept (capture-pane -e).
+    Batched like detect_statuses; sessions that vanished are omitted.
+    """
+    flags = ["-p", "-S", f"-{scrollback}"] if scrollback else ["-p"]
+    if escapes:
+        flags.append("-e")
+    captured: dict[str, str] = {}
+    for i in range(0, len(session_ids), _PROBE_BATCH):
+        batch = session_ids[i:i + _PROBE_BATCH]
+        results = await _run_many(
+            [["capture-pane", "-t", f"={sid}:", *flags] for sid in batch]
+        )
+        for sid, (rc, out) in zip(batch, results):
+            if rc == 0:
+                captured[sid] = out
+    return captured
+
+
+def _status_from_lines(lines: str) -> str:
     lower = lines.lower()
     if "esc to interrupt" in lower:
         return "working"
     if "(running)" in lower:
         return "idle+bg"
     return "idle"
+
+
+async def detect_statuses(
+    session_ids: Optional[Iterable[str]] = None,
+) -> dict[str, str]:
+    """Return {session_id: status} for the alive sessions among session_ids.
+
+    Sessions that don't exist are omitted. With session_ids=None every tmux
+    session is probed. Only used for sessions that don't report their state
+    through status hooks. Costs one list-sessions plus one capture round-trip
+    per _PROBE_BATCH sessions, regardless of how many sessions are alive.
+    """
+    alive = await list_tmux_sessions()
+    if session_ids is None:
+        targets = alive
+    else:
+        alive_set = set(alive)
+        targets = [sid for sid in dict.fromkeys(session_ids) if sid in alive_set]
+
+    statuses: dict[str, str] = {}
+    for i in range(0, len(targets), _PROBE_BATCH):
+        batch = targets[i:i + _PROBE_BATCH]
+        results = await _run_many(
+            [["capture-pane", "-t", f"={sid}:", "-p", "-S", "-5"] for sid in batch]
+        )
+        for sid, (rc, out) in zip(batch, results):
+            # 探测期间退出的会话视为不存在
+            if rc == 0:
+                statuses[sid] = _status_from_lines(out)
+    return statuses
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+from ..config import WORKDIR_BASE
+from . import fs_watcher
+
+logger = logging.getLogger(__name__)
+
+# 两次增量更新之间的最小间隔（秒）
+_MIN_GAP = 1.0
+
+
+def list_usernames() -> list[str]:
+    if not WORKDIR_BASE.exists():
+        return []
+    return [d.name for d in sorted(WORKDIR_BASE.iterdir()) if d.is_dir()]
+
+
+class TranscriptIndex:
+    """A sqlite database derived from session transcripts, kept current in the background.
+
+    All writes go through one writer thread, which also creates the schema;
+    queries use a read-only connection per calling thread. When
+    schema_version differs from the database's user_version, the reset
+    script runs first so derived tables are rebuilt. The update loop
+    runs update(conn, usernames) for the users fs_watcher reported, or for
+    everyone (usernames=None) on a full pass, which without a watcher happens
+    every `interval` seconds.
+    """
+
+    def __init__(self, name: str, db_path: Path, schema: str,
+                 update: Callable[[sqlite3.Connection, Optional[list[str]]], int],
+                 interval: float, full_pass_on_delete: bool,
+                 schema_version: int = 0, reset: str = ""):
+        self.name = name
+        self.db_path = db_path
+        self._schema = schema
+        self._update = update
+        self._interval = interval
+        self._full_pass_on_delete = full_pass_on_delete
+        self._schema_version = schema_version
+        self._reset = reset
+        self._writer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._writer: Optional[sqlite3.Connection] = None
+        self._readers = threading.local()
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._changed_users: set[str] = set()
+        self._full_pass_due = True
+
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def writer_conn(self) -> sqlite3.Connection:
+        """The writer connection; only call on the writer thread."""
+        if self._writer is None:
+            conn = self._connect()
+            if conn.execute("PRAGMA user_version").fetchone()[0] != self._schema_version:
+                conn.executescript(self._reset)
+                conn.execute(f"PRAGMA user_version = {int(self._schema_version)}")
+            conn.executescript(self._schema)
+            self._writer = conn
+        return self._writer
+
+    def reader_conn(self) -> sqlite3.Connection:
+        # 表由写线程创建；尚未建立时查询会抛 OperationalError，由调用方处理
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            conn = self._readers.conn = self._connect()
+        return conn
+
+    async def run_on_writer(self, fn: Callable, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer_pool, fn, *args)
+
+    def update(self, usernames: Optional[list[str]] = None) -> int:
+        """Run one update pass; only call on the writer thread."""
+        return self._update(self.writer_conn(), usernames)
+
+    async def update_async(self, usernames: Optional[list[str]] = None) -> int:
+        return await self.run_on_writer(self.update, usernames)
+
+    def apply_changes(self, changes: list[fs_watcher.Change]):
+        """fs_watcher subscriber: queue the users whose transcripts changed."""
+        for change in changes:
+            if change.kind == "rescan" or (change.kind == "deleted" and self._full_pass_on_delete):
+                # 删除需要与全部文件比对才能清掉旧记录
+                self._full_pass_due = True
+                continue
+            if change.kind == "deleted":
+                continue
+            project_dir = change.path.parent if change.path.suffix == ".jsonl" else change.path
+            username = fs_watcher.username_for(project_dir)
+            if username is not None:
+                self._changed_users.add(username)
+        self._wake.set()
+
+    async def _update_loop(self):
+        while True:
+            full = self._full_pass_due
+            users = sorted(self._changed_users)
+            self._full_pass_due = False
+            self._changed_users.clear()
+            try:
+                added = await self.update_async(None if full else users) if full or users else 0
+                if added:
+                    logger.info(f"{self.name}: {added} new messages")
+            except Exception as e:
+                logger.warning(f"{self.name} update failed: {e}")
+            # 活跃会话的写入很频繁，两次增量之间至少间隔 _MIN_GAP 秒
+            await asyncio.sleep(_MIN_GAP)
+            if fs_watcher.active():
+                # 有文件监听时只在变动后更新，空闲时不触碰磁盘
+                await self._wake.wait()
+            else:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self._interval - _MIN_GAP)
+                except asyncio.TimeoutError:
+                    self._full_pass_due = True
+            self._wake.clear()
+
+    def start(self):
+        self._task = asyncio.create_task(self._update_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,304 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+import yaml
+
+from ..config import (
+    SCHEDULES_DIR,
+    YAML_LOADER,
+    USAGE_UPDATE_INTERVAL,
+    TRANSCRIPT_MAX_LINE_BYTES,
+    get_claude_project_dir,
+)
+from .claude_session import UUID_RE, read_line
+from .transcript_index import TranscriptIndex, list_usernames
+
+logger = logging.getLogger(__name__)
+
+USAGE_DB = SCHEDULES_DIR / "usage.db"
+# 可选的价格表：模型名前缀 -> 每百万 token 的美元价格
+PRICES_FILE = SCHEDULES_DIR / "prices.yaml"
+
+FIELDS = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+# 分组方式 -> (SQL 表达式, 输出字段名)
+GROUPS = {
+    "user": (("username", "username"),),
+    "session": (("username", "username"), ("session_id", "session_id")),
+    "schedule": (("username", "username"), ("task", "task")),
+    "model": (("model", "model"),),
+    "day": (("substr(hour, 1, 10)", "day"),),
+    "hour": (("hour", "hour"),),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    inode INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    last_msg_id TEXT NOT NULL DEFAULT '',
+    last_usage TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS usage (
+    username TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    hour TEXT NOT NULL,
+    model TEXT NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cache_creation_input_tokens INTEGER NOT NULL DEFAULT 0,
+    cache_read_input_tokens INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, session_id, hour, model)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS usage_hour ON usage (hour);
+CREATE TABLE IF NOT EXISTS session_tasks (
+    session_id TEXT PRIMARY KEY,
+    task TEXT NOT NULL
+);
+"""
+
+_UPSERT = (
+    "INSERT INTO usage (username, session_id, hour, model, messages, "
+    + ", ".join(FIELDS) + ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (username, session_id, hour, model) DO UPDATE SET "
+    "messages = messages + excluded.messages, "
+    + ", ".join(f"{f} = {f} + excluded.{f}" for f in FIELDS)
+)
+
+_prices: dict[str, dict] = {}
+_prices_version: Optional[tuple[int, int]] = None
+
+
+def _ingest_file(conn: sqlite3.Connection, path: Path, username: str, row) -> int:
+    """Add the usage of lines appended since the checkpoint; returns messages counted.
+
+    Claude writes one line per content block, each repeating the message's
+    usage, so consecutive lines of one message id only add what grew.
+    """
+    st = path.stat()
+    if row is not None:
+        inode, offset, last_id, last_usage = row
+        if inode != st.st_ino or st.st_size < offset:
+            # 文件被替换或截断：已计入的用量保留，从头计入新内容
+            row = None
+        elif st.st_size == offset:
+            return 0
+    if row is None:
+        offset, last_id, last_usage = 0, "", "{}"
+    counted = json.loads(last_usage)
+
+    totals: dict[tuple[str, str], list[int]] = {}
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            head, n, complete = read_line(f, TRANSCRIPT_MAX_LINE_BYTES)
+            if not complete:
+                break
+            offset += n
+            if n > len(head) or b'"usage"' not in head:
+                continue
+            try:
+                obj = json.loads(head)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            msg = obj.get("message") if isinstance(obj, dict) else None
+            usage = msg.get("usage") if isinstance(msg, dict) else None
+            if not isinstance(usage, dict):
+                continue
+            try:
+                values = {k: int(usage.get(k) or 0) for k in FIELDS}
+            except (TypeError, ValueError):
+                # 用量字段不是数字：跳过这一行，不影响其余内容的计入
+                logger.warning(f"Skipping malformed usage at {path}:{offset - n}")
+                continue
+            msg_id = str(msg.get("id", ""))
+            new_message = not msg_id or msg_id != last_id
+            if new_message:
+                delta = values
+                counted = values
+            else:
+                delta = {k: max(0, values[k] - counted.get(k, 0)) for k in FIELDS}
+                counted = {k: max(values[k], counted.get(k, 0)) for k in FIELDS}
+            last_id = msg_id
+            bucket = totals.setdefault(
+                (str(obj.get("timestamp", ""))[:13], str(msg.get("model", ""))), [0] * 5
+            )
+            bucket[0] += 1 if new_message else 0
+            for i, k in enumerate(FIELDS, 1):
+                bucket[i] += delta[k]
+
+    conn.executemany(
+        _UPSERT,
+        [(username, path.stem, hour, model, *vals) for (hour, model), vals in totals.items()],
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO files (path, inode, offset, last_msg_id, last_usage)"
+        " VALUES (?, ?, ?, ?, ?)",
+        (str(path), st.st_ino, offset, last_id, json.dumps(counted)),
+    )
+    conn.commit()
+    return sum(v[0] for v in totals.values())
+
+
+def _update(conn: sqlite3.Connection, usernames: Optional[list[str]]) -> int:
+    """Fold newly appended transcript lines into the rollups; returns messages added.
+
+    Runs on the usage writer thread. Usage of deleted transcripts is kept.
+    """
+    known = {
+        path: (inode, offset, last_id, last_usage)
+        for path, inode, offset, last_id, last_usage in conn.execute(
+            "SELECT path, inode, offset, last_msg_id, last_usage FROM files"
+        )
+    }
+    added = 0
+    for username in usernames if usernames is not None else list_usernames():
+        try:
+            entries = list(os.scandir(get_claude_project_dir(username)))
+        except OSError:
+            continue
+        for de in entries:
+            if not de.name.endswith(".jsonl") or not UUID_RE.match(de.name[:-6]):
+                continue
+            try:
+                added += _ingest_file(conn, Path(de.path), username, known.get(de.path))
+            except OSError as e:
+                logger.debug(f"Usage ingest skipped {de.path}: {e}")
+    return added
+
+
+# 删除的对话记录其用量仍保留，不需要为删除做全量比对
+_index = TranscriptIndex("Usage", USAGE_DB, _SCHEMA, _update,
+                         USAGE_UPDATE_INTERVAL, full_pass_on_delete=False)
+update = _index.update
+update_async = _index.update_async
+apply_changes = _index.apply_changes
+start = _index.start
+stop = _index.stop
+
+
+def _tag_session(session_id: str, task: str):
+    conn = _index.writer_conn()
+    conn.execute("INSERT OR REPLACE INTO session_tasks (session_id, task) VALUES (?, ?)",
+                 (session_id, task))
+    conn.commit()
+
+
+async def tag_session(session_id: str, task: str):
+    """Attribute a session's usage to a scheduled task."""
+    await _index.run_on_writer(_tag_session, session_id, task)
+
+
+def _load_prices() -> dict[str, dict]:
+    global _prices, _prices_version
+    try:
+        st = PRICES_FILE.stat()
+    except FileNotFoundError:
+        _prices, _prices_version = {}, None
+        return _prices
+    version = (st.st_mtime_ns, st.st_size)
+    if version != _prices_version:
+        with open(PRICES_FILE, encoding="utf-8") as f:
+            data = yaml.load(f, Loader=YAML_LOADER)
+        _prices = data if isinstance(data, dict) else {}
+        _prices_version = version
+    return _prices
+
+
+def _cost(model: str, tokens: dict, prices: dict[str, dict]) -> Optional[float]:
+    # 取最长匹配的模型名前缀；价格表里没有的模型不计费用
+    matches = [p for p in prices if model.startswith(p)]
+    if not matches:
+        return None
+    price = prices[max(matches, key=len)]
+    return (
+        tokens["input_tokens"] * price.get("input", 0)
+        + tokens["output_tokens"] * price.get("output", 0)
+        + tokens["cache_creation_input_tokens"] * price.get("cache_write", 0)
+        + tokens["cache_read_input_tokens"] * price.get("cache_read", 0)
+    ) / 1_000_000
+
+
+def rollup(
+    group: str,
+    usernames: Optional[list[str]] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = 1000,
+) -> list[dict]:
+    """Token and cost totals grouped by user, session, schedule, model, day or hour.
+
+    since/until are ISO timestamp prefixes compared against the hour bucket.
+    Rows are ordered by total tokens, largest first.
+    """
+    if usernames is not None and not usernames:
+        return []
+    keys = GROUPS[group]
+    names = [name for _, name in keys]
+    select = ", ".join(f"{expr} AS {name}" for expr, name in keys)
+    sql = (
+        f"SELECT {select}, model, sum(messages), "
+        + ", ".join(f"sum({f})" for f in FIELDS)
+        + " FROM usage"
+    )
+    if group == "schedule":
+        sql += " JOIN session_tasks USING (session_id)"
+    where, params = [], []
+    if usernames is not None:
+        where.append(f"username IN ({', '.join('?' * len(usernames))})")
+        params += usernames
+    if since:
+        where.append("hour >= ?")
+        params.append(since[:13])
+    if until:
+        where.append("hour < ?")
+        params.append(until[:13])
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" GROUP BY {', '.join(names)}, model"
+
+    if not USAGE_DB.exists():
+        return []
+    try:
+        found = _index.reader_conn().execute(sql, params).fetchall()
+    except sqlite3.OperationalError as e:
+        # 写线程尚未建表
+        logger.debug(f"Usage query failed: {e}")
+        return []
+    prices = _load_prices()
+    rows: dict[tuple, dict] = {}
+    for r in found:
+        key = r[:len(keys)]
+        model = r[len(keys)]
+        tokens = dict(zip(FIELDS, r[len(keys) + 2:]))
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = {
+                **dict(zip(names, key)), "messages": 0, **{f: 0 for f in FIELDS},
+                "total_tokens": 0, "cost": None,
+            }
+        row["messages"] += r[len(keys) + 1]
+        for f in FIELDS:
+            row[f] += tokens[f]
+        row["total_tokens"] += sum(tokens.values())
+        cost = _cost(model, tokens, prices)
+        if cost is not None:
+            row["cost"] = (row["cost"] or 0.0) + cost
+    result = sorted(rows.values(), key=lambda r: r["total_tokens"], reverse=True)
+    return result[:limit]
+
+
+async def rollup_async(
+    group: str,
+    usernames: Optional[list[str]] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = 1000,
+) -> list[dict]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, rollup, group, usernames, since, until, limit)
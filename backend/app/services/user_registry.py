@@ -0,0 +1,61 @@
+import threading
+import time
+from typing import Optional
+
+from ..config import USERS_FILE, USERS_RELOAD_INTERVAL, get_user_workdir, load_users
+
+
+class UserRegistry:
+    """users.yaml parsed once into a dict keyed by uid, reloaded when the file changes.
+
+    The file is stat'ed at most once per USERS_RELOAD_INTERVAL seconds, so a
+    lookup is a dict access no matter how many accounts exist.
+    """
+
+    def __init__(self):
+        self._users: dict[str, dict] = {}
+        self._version: Optional[tuple[int, int]] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._workdirs_ready: set[str] = set()
+
+    def _file_version(self) -> Optional[tuple[int, int]]:
+        try:
+            st = USERS_FILE.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < USERS_RELOAD_INTERVAL and self._checked_at:
+            return
+        with self._lock:
+            self._checked_at = now
+            version = self._file_version()
+            if version == self._version:
+                return
+            users = {}
+            for u in load_users():
+                if isinstance(u, dict) and u.get("uid") is not None:
+                    users[str(u["uid"])] = u
+            self._users = users
+            self._version = version
+
+    def get(self, uid: str) -> Optional[dict]:
+        self._refresh()
+        return self._users.get(uid)
+
+    def all(self) -> list[dict]:
+        self._refresh()
+        return list(self._users.values())
+
+    def ensure_workdir(self, uid: str):
+        """Create the user's workdir once per process instead of on every login."""
+        if uid in self._workdirs_ready:
+            return
+        get_user_workdir(uid).mkdir(parents=True, exist_ok=True)
+        self._workdirs_ready.add(uid)
+
+
+registry = UserRegistry()
@@ -0,0 +1,64 @@
+"""Compare two benchmark result files metric by metric.
+
+    python -m bench.compare bench/results/OLD.json bench/results/NEW.json
+
+Latencies (*_ms) are better when lower and throughputs (rps, *_mb_s) when
+higher; changes beyond --threshold in the wrong direction are marked and
+make the command exit with status 1.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def _flatten(obj, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            flat.update(_flatten(value, f"{prefix}.{key}" if prefix else key))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        flat[prefix] = float(obj)
+    return flat
+
+
+def _direction(key: str) -> int:
+    """+1 if higher is better, -1 if lower is better, 0 if neither."""
+    leaf = key.rsplit(".", 1)[-1]
+    if leaf.endswith("_ms"):
+        return -1
+    if leaf == "rps" or "mb_s" in leaf:
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("old", type=Path)
+    parser.add_argument("new", type=Path)
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent")
+    args = parser.parse_args()
+
+    old, new = (json.loads(p.read_text()) for p in (args.old, args.new))
+    print(f"old: {old['meta'].get('commit')}  new: {new['meta'].get('commit')}")
+    a, b = _flatten(old["results"]), _flatten(new["results"])
+    regressions = 0
+    width = max((len(k) for k in a.keys() & b.keys()), default=10)
+    for key in sorted(a.keys() & b.keys()):
+        direction = _direction(key)
+        if direction == 0:
+            continue
+        before, after = a[key], b[key]
+        change = (after - before) / before * 100 if before else 0.0
+        mark = ""
+        if direction * change < -args.threshold:
+            mark = "  REGRESSION"
+            regressions += 1
+        elif direction * change > args.threshold:
+            mark = "  improved"
+        print(f"{key:<{width}}  {before:>12.3f}  {after:>12.3f}  {change:+7.1f}%{mark}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Load drivers: each one exercises a running server and returns a JSON-able dict."""
+import asyncio
+import http.client
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import websockets
+
+from .gen import write_users
+
+
+def summarize(samples: list[float], elapsed: float, errors: int = 0) -> dict:
+    """Latency percentiles (ms) and throughput of a list of durations in seconds."""
+    if not samples:
+        return {"count": 0, "errors": errors}
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "p50_ms": pct(0.50),
+        "p99_ms": pct(0.99),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "rps": round(len(samples) / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+class Client:
+    """A keep-alive HTTP connection; one per worker thread."""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+
+    def call(self, method: str, path: str, body=None, token: str = None):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        data = json.dumps(body).encode() if body is not None else None
+        try:
+            self.conn.request(method, path, body=data, headers=headers)
+            resp = self.conn.getresponse()
+            payload = resp.read()
+        except (http.client.HTTPException, OSError):
+            # 连接被服务端关闭，重连后重试一次
+            self.conn.close()
+            self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            self.conn.request(method, path, body=data, headers=headers)
+            resp = self.conn.getresponse()
+            payload = resp.read()
+        return resp.status, json.loads(payload) if payload else None
+
+
+def hammer(port: int, calls: list, concurrency: int) -> tuple[list[float], int, float]:
+    """Run calls (fn(client) -> status) on `concurrency` threads.
+
+    Returns (latencies, errors, elapsed).
+    """
+    local = threading.local()
+
+    def timed(fn):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = Client(port)
+        start = time.perf_counter()
+        try:
+            status = fn(client)
+        except Exception:
+            status = 0
+        return time.perf_counter() - start, status < 400 and status != 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, calls))
+    elapsed = time.perf_counter() - start
+    latencies = [d for d, ok in results if ok]
+    return latencies, sum(1 for _, ok in results if not ok), elapsed
+
+
+def login_tokens(port: int, uids: list[str]) -> dict[str, str]:
+    client = Client(port)
+    tokens = {}
+    for uid in uids:
+        status, data = client.call("POST", "/api/login", {"uid": uid, "password": uid})
+        if status != 200:
+            raise RuntimeError(f"login failed for {uid}: {status} {data}")
+        tokens[uid] = data["token"]
+    return tokens
+
+
+def bench_login(port: int, home: Path, counts: list[int], requests: int, concurrency: int,
+                reload_wait: float = 1.5) -> dict:
+    """Login latency for growing account files; should stay flat."""
+    result = {}
+    rng = random.Random(7)
+    for count in counts:
+        uids = write_users(home, count)
+        # 等账号文件的热加载生效，并用一次登录预热
+        time.sleep(reload_wait)
+        login_tokens(port, [uids[-1]])
+        picks = [rng.choice(uids) for _ in range(requests)]
+        calls = [
+            (lambda c, u=u: c.call("POST", "/api/login", {"uid": u, "password": u})[0])
+            for u in picks
+        ]
+        latencies, errors, elapsed = hammer(port, calls, concurrency)
+        result[str(count)] = summarize(latencies, elapsed, errors)
+    return result
+
+
+def bench_get(port: int, path: str, tokens: list[str], requests: int, concurrency: int) -> dict:
+    """Latency of GET path; the first request per token is reported as cold."""
+    cold, cold_errors, cold_elapsed = hammer(
+        port, [(lambda c, t=t: c.call("GET", path, token=t)[0]) for t in tokens], concurrency
+    )
+    calls = [
+        (lambda c, t=tokens[i % len(tokens)]: c.call("GET", path, token=t)[0])
+        for i in range(requests)
+    ]
+    latencies, errors, elapsed = hammer(port, calls, concurrency)
+    return {"cold": summarize(cold, cold_elapsed, cold_errors), "warm": summarize(latencies, elapsed, errors)}
+
+
+def bench_schedules(port: int, tokens: list[str], rounds: int, concurrency: int) -> dict:
+    """Create, list, update and delete schedules, each user working on its own file."""
+    samples: dict[str, list[float]] = {"create": [], "list": [], "update": [], "delete": []}
+    errors = {op: 0 for op in samples}
+    lock = threading.Lock()
+
+    def cycle(i: int):
+        client = Client(port)
+        token = tokens[i % len(tokens)]
+        name = f"bench-{i}"
+        steps = [
+            ("create", "POST", "/api/schedules",
+             {"name": name, "content": "run the report", "cron": "0 3 * * *", "enabled": False}),
+            ("list", "GET", "/api/schedules", None),
+            ("update", "PUT", f"/api/schedules/{name}", {"cron": "30 4 * * *"}),
+            ("delete", "DELETE", f"/api/schedules/{name}", None),
+        ]
+        for op, method, path, body in steps:
+            start = time.perf_counter()
+            try:
+                status, _ = client.call(method, path, body, token)
+            except Exception:
+                status = 0
+            elapsed = time.perf_counter() - start
+            with lock:
+                if 0 < status < 400:
+                    samples[op].append(elapsed)
+                else:
+                    errors[op] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(cycle, range(rounds)))
+    elapsed = time.perf_counter() - start
+    return {op: summarize(samples[op], elapsed, errors[op]) for op in samples}
+
+
+async def _read_terminal(url: str, duration: float) -> dict:
+    start = time.perf_counter()
+    first = None
+    total = frames = 0
+    error = None
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            await ws.send(json.dumps({"type": "resize", "rows": 40, "cols": 120}))
+            deadline = start + duration
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    msg = await asyncio.wait_for(ws.recv(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if isinstance(msg, str):
+                    error = msg
+                    break
+                if first is None:
+                    first = time.perf_counter() - start
+                total += len(msg)
+                frames += 1
+    except Exception as e:
+        error = str(e)
+    return {"bytes": total, "frames": frames, "ttfb": first, "error": error}
+
+
+async def _terminals(port: int, token: str, session_ids: list[str], duration: float) -> dict:
+    urls = [f"ws://127.0.0.1:{port}/api/ws/terminal/{sid}?token={token}" for sid in session_ids]
+    results = await asyncio.gather(*(_read_terminal(u, duration) for u in urls))
+    rates = sorted(r["bytes"] / duration / 1e6 for r in results)
+    ttfbs = [r["ttfb"] for r in results if r["ttfb"] is not None]
+    return {
+        "clients": len(urls),
+        "duration_s": duration,
+        "total_mb_s": round(sum(rates), 2),
+        "client_mb_s_min": round(rates[0], 2),
+        "client_mb_s_p50": round(rates[len(rates) // 2], 2),
+        "client_mb_s_max": round(rates[-1], 2),
+        "frames": sum(r["frames"] for r in results),
+        "ttfb_p50_ms": summarize(ttfbs, 1).get("p50_ms"),
+        "ttfb_p99_ms": summarize(ttfbs, 1).get("p99_ms"),
+        "errors": sum(1 for r in results if r["error"]),
+    }
+
+
+def bench_terminals(port: int, token: str, sessions: int, fanout: int, duration: float) -> dict:
+    """Throughput of many terminals, and of one terminal shared by many viewers."""
+    client = Client(port)
+    created = []
+    for _ in range(max(sessions, 1)):
+        status, data = client.call("POST", "/api/sessions", token=token)
+        if status != 200:
+            raise RuntimeError(f"create session failed: {status} {data}")
+        created.append(data["session_id"])
+    try:
+        spread = asyncio.run(_terminals(port, token, created[:sessions], duration))
+        shared = asyncio.run(_terminals(port, token, [created[0]] * fanout, duration))
+    finally:
+        for sid in created:
+            client.call("DELETE", f"/api/sessions/{sid}", token=token)
+    return {"sessions": spread, "fanout": shared}
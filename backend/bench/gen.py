@@ -0,0 +1,112 @@
+"""Generate a synthetic ClaudeCoHub home: accounts and session transcripts.
+
+    python -m bench.gen --home /tmp/bench-home --users 50 --sessions 40
+
+Session sizes follow a log-normal distribution of message counts, so most
+transcripts are small and a few are very large, as in real use. The same
+seed always produces the same tree.
+"""
+import argparse
+import json
+import math
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import yaml
+
+from app.config import encode_path_for_claude
+
+_WORDS = (
+    "refactor the parser add tests fix the flaky build update docs review this "
+    "diff why does the handler leak memory explain the scheduler and the tmux "
+    "bridge rename variables check the logs run the migration"
+).split()
+_TOOLS = ("Bash", "Read", "Edit", "Grep", "Glob", "Write")
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def write_users(home: Path, count: int, prefix: str = "bench") -> list[str]:
+    """Write users.yaml with `count` accounts whose password equals their uid."""
+    uids = [f"{prefix}{i:05d}" for i in range(count)]
+    path = home / ".claude" / "claudecohub" / "users.yaml"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        yaml.safe_dump([{"uid": u, "username": u, "password": u} for u in uids], f)
+    tmp.replace(path)
+    return uids
+
+
+def _session(rng: random.Random, session_id: str, cwd: str, messages: int,
+             start: datetime) -> str:
+    lines = []
+    ts = start
+    for i in range(messages):
+        ts += timedelta(seconds=rng.randrange(1, 120))
+        base = {"sessionId": session_id, "uuid": str(uuid.uuid4()), "cwd": cwd,
+                "timestamp": ts.isoformat().replace("+00:00", "Z")}
+        if i % 2 == 0:
+            content = _text(rng, rng.randrange(5, 60))
+            lines.append({**base, "type": "user", "message": {"role": "user", "content": content}})
+            continue
+        if rng.random() < 0.4:
+            content = [{"type": "tool_use", "id": f"toolu_{i}", "name": rng.choice(_TOOLS),
+                        "input": {"command": _text(rng, 6)}}]
+        else:
+            # 偶尔出现很长的回复，模拟大段代码或日志
+            words = int(rng.lognormvariate(4, 1.2))
+            content = [{"type": "text", "text": _text(rng, min(words, 20000))}]
+        lines.append({**base, "type": "assistant", "message": {
+            "id": f"msg_{session_id[:8]}_{i}", "role": "assistant", "model": "claude-stub",
+            "content": content,
+            "usage": {"input_tokens": rng.randrange(10, 500), "output_tokens": rng.randrange(10, 2000),
+                      "cache_read_input_tokens": rng.randrange(0, 50000)},
+        }})
+    return "".join(json.dumps(l, ensure_ascii=False) + "\n" for l in lines)
+
+
+def generate(home: Path, users: int, sessions: int, median_messages: int = 60,
+             sigma: float = 1.0, max_messages: int = 5000, seed: int = 1) -> dict:
+    """Create users × sessions transcripts under home; returns a summary."""
+    rng = random.Random(seed)
+    uids = write_users(home, users)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    files = total_bytes = 0
+    for uid in uids:
+        workdir = home / "workdir" / uid
+        workdir.mkdir(parents=True, exist_ok=True)
+        project = home / ".claude" / "projects" / encode_path_for_claude(workdir)
+        project.mkdir(parents=True, exist_ok=True)
+        for _ in range(sessions):
+            sid = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+            messages = min(max_messages, max(1, int(rng.lognormvariate(math.log(median_messages), sigma))))
+            data = _session(rng, sid, str(workdir), messages, start + timedelta(hours=rng.randrange(0, 5000)))
+            (project / f"{sid}.jsonl").write_text(data)
+            files += 1
+            total_bytes += len(data.encode())
+        # 只有摘要、没有对话的文件，会话发现时应被过滤掉
+        summary = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        (project / f"{summary}.jsonl").write_text(json.dumps({"type": "summary", "summary": "x"}) + "\n")
+    return {"users": users, "sessions_per_user": sessions, "files": files, "bytes": total_bytes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--home", type=Path, required=True)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=40, help="sessions per user")
+    parser.add_argument("--median-messages", type=int, default=60)
+    parser.add_argument("--sigma", type=float, default=1.0, help="log-normal spread of session sizes")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(generate(args.home, args.users, args.sessions, args.median_messages,
+                              args.sigma, seed=args.seed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Run the benchmark suite against a throw-away server and save the results as JSON.
+
+    cd backend && python -m bench.run
+    python -m bench.run --users 200 --sessions 100 --only sessions,overview
+    python -m bench.compare bench/results/OLD.json bench/results/NEW.json
+
+Everything runs offline: a temporary HOME gets synthetic accounts and
+transcripts, and stub tmux/claude executables (bench/stubs) stand in for
+the real ones, so the numbers measure this code and not the machine's tmux.
+Pass --real-tmux to use the installed tmux on a private socket instead.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import drivers
+from .gen import generate, write_users
+
+BENCH_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCH_DIR.parent
+STUBS_DIR = BENCH_DIR / "stubs"
+RESULTS_DIR = BENCH_DIR / "results"
+
+DRIVERS = ("sessions", "overview", "schedules", "terminals", "login")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _git_revision() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True,
+                                  text=True, timeout=30).stdout.strip()
+        except (OSError, subprocess.TimeoutExpired):
+            return ""
+
+    return {"commit": git("rev-parse", "--short", "HEAD"), "dirty": bool(git("status", "--porcelain", "--", "app"))}
+
+
+def _rss_mb(pid: int) -> float | None:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _tmux_env(home: Path) -> dict:
+    env = os.environ.copy()
+    # $TMUX 指向当前所在的 tmux 服务器，会覆盖 TMUX_TMPDIR，必须去掉
+    env.pop("TMUX", None)
+    env["TMUX_TMPDIR"] = str(home / "tmux")
+    return env
+
+
+def start_server(home: Path, port: int, real_tmux: bool, extra_env: dict) -> subprocess.Popen:
+    env = _tmux_env(home)
+    env.update({
+        "HOME": str(home),
+        "JWT_SECRET": "bench",
+        "PATH": f"{STUBS_DIR}:{env.get('PATH', '')}",
+        "FAKE_TMUX_DIR": str(home / "fake-tmux"),
+    })
+    if real_tmux:
+        real = shutil.which("tmux")
+        if real is None:
+            raise SystemExit("--real-tmux: tmux is not installed")
+        # 只替换 claude，tmux 用真实的（私有 socket 目录，不影响本机会话）
+        shim = home / "bin"
+        shim.mkdir(exist_ok=True)
+        (shim / "tmux").symlink_to(real)
+        env["PATH"] = f"{shim}:{env['PATH']}"
+        (home / "tmux").mkdir(exist_ok=True)
+    env.update(extra_env)
+    log = open(home / "server.log", "w")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited, see {home / 'server.log'}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("server did not start within 30 s")
+
+
+def stop_server(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=40, help="transcripts per user")
+    parser.add_argument("--median-messages", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=500, help="requests per HTTP driver")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--login-users", default="100,1000,5000",
+                        help="account-file sizes for the login driver")
+    parser.add_argument("--terminals", type=int, default=8, help="terminals read in parallel")
+    parser.add_argument("--fanout", type=int, default=16, help="viewers of one shared terminal")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per terminal driver")
+    parser.add_argument("--only", default=",".join(DRIVERS), help="comma-separated drivers to run")
+    parser.add_argument("--real-tmux", action="store_true")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra server environment, e.g. --env TMUX_CONTROL_MODE=0")
+    parser.add_argument("--out", type=Path, help="result file (default bench/results/<time>-<commit>.json)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary HOME")
+    args = parser.parse_args()
+
+    only = [d for d in args.only.split(",") if d]
+    unknown = set(only) - set(DRIVERS)
+    if unknown:
+        parser.error(f"unknown drivers: {', '.join(sorted(unknown))}")
+    extra_env = dict(kv.split("=", 1) for kv in args.env)
+
+    home = Path(tempfile.mkdtemp(prefix="claudecohub-bench-"))
+    started = time.perf_counter()
+    print(f"Generating data in {home} ...", file=sys.stderr)
+    data = generate(home, args.users, args.sessions, args.median_messages, seed=args.seed)
+
+    port = _free_port()
+    server = start_server(home, port, args.real_tmux, extra_env)
+    results: dict = {}
+    try:
+        uids = [f"bench{i:05d}" for i in range(args.users)]
+        tokens = drivers.login_tokens(port, uids)
+        all_tokens = list(tokens.values())
+        for name in only:
+            print(f"Running {name} ...", file=sys.stderr)
+            if name == "sessions":
+                results[name] = drivers.bench_get(port, "/api/sessions", all_tokens,
+                                                  args.requests, args.concurrency)
+            elif name == "overview":
+                results[name] = drivers.bench_get(port, "/api/admin/overview", all_tokens[:4],
+                                                  max(args.requests // 5, 1), min(args.concurrency, 4))
+            elif name == "schedules":
+                results[name] = drivers.bench_schedules(port, all_tokens, args.requests // 4,
+                                                        args.concurrency)
+            elif name == "terminals":
+                results[name] = drivers.bench_terminals(port, all_tokens[0], args.terminals,
+                                                        args.fanout, args.duration)
+            elif name == "login":
+                counts = [int(c) for c in args.login_users.split(",") if c]
+                results[name] = drivers.bench_login(port, home, counts, args.requests, args.concurrency)
+                # 恢复数据集原本的账号
+                write_users(home, args.users)
+        rss = _rss_mb(server.pid)
+    finally:
+        stop_server(server)
+        if args.real_tmux:
+            subprocess.run(["tmux", "kill-server"], env=_tmux_env(home), capture_output=True)
+        if not args.keep:
+            shutil.rmtree(home, ignore_errors=True)
+
+    report = {
+        "meta": {
+            **_git_revision(),
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "tmux": "real" if args.real_tmux else "stub",
+            "env": extra_env,
+            "params": {k: v for k, v in vars(args).items() if k not in ("out", "keep", "env")},
+            "data": data,
+            "server_rss_mb": rss,
+            "wall_s": round(time.perf_counter() - started, 1),
+        },
+        "results": results,
+    }
+    out = args.out
+    if out is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        out = RESULTS_DIR / f"{stamp}-{report['meta']['commit'] or 'nogit'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2) + "\n")
+    print(json.dumps(results, indent=2))
+    print(f"Saved {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
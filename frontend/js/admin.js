@@ -7,16 +7,41 @@ function logout() {
     window.location.href = '/index.html';
 }
 
+let overviewUsers = [];
+let loadingOverview = false;
+
+// Fetch the overview page by page, rendering each page as it arrives.
 async function loadOverview() {
+    if (loadingOverview) return;
+    loadingOverview = true;
     try {
-        const data = await apiFetch('/api/admin/overview');
-        renderUsers(data.users);
-        renderSchedules(data.schedules);
+        const previous = overviewUsers;
+        const users = [];
+        let offset = 0;
+        while (offset !== null) {
+            const data = await apiFetch(`/api/admin/overview?offset=${offset}`);
+            if (data.schedules) renderSchedules(data.schedules);
+            users.push(...data.users);
+            // Keep the previous load's tail on screen until its page is refreshed
+            overviewUsers = users.concat(previous.slice(users.length));
+            renderUsers(overviewUsers);
+            offset = data.next_offset;
+        }
+        overviewUsers = users;
+        renderUsers(users);
     } catch (err) {
         console.error('Failed to load overview:', err);
+    } finally {
+        loadingOverview = false;
     }
 }
 
+function formatUsage(usage) {
+    if (!usage) return '';
+    const cost = usage.cost == null ? '' : ` · $${usage.cost.toFixed(2)}`;
+    return ` <span style="font-weight:normal;color:var(--text-muted);font-size:0.85em">${usage.total_tokens.toLocaleString()} tokens${cost}</span>`;
+}
+
 function renderUsers(users) {
     const container = document.getElementById('usersContainer');
     if (users.length === 0) {
@@ -24,7 +49,7 @@ function renderUsers(users) {
         return;
     }
     container.innerHTML = users.map(u => `
-        <h3 style="margin:1rem 0 0.5rem">${u.username} (${u.sessions.length})</h3>
+        <h3 style="margin:1rem 0 0.5rem">${u.username} (${u.sessions.length})${formatUsage(u.usage)}</h3>
         <div class="table-wrap">
             <table>
                 <thead>
@@ -33,17 +58,23 @@ function renderUsers(users) {
                         <th>First Message</th>
                         <th>Updated</th>
                         <th>Status</th>
+                        <th>Actions</th>
                     </tr>
                 </thead>
                 <tbody>
                     ${u.sessions.length === 0
-                        ? '<tr><td colspan="4" style="text-align:center;color:var(--text-muted)">No sessions</td></tr>'
+                        ? '<tr><td colspan="5" style="text-align:center;color:var(--text-muted)">No sessions</td></tr>'
                         : u.sessions.map(s => `
                             <tr>
                                 <td><code>${s.session_id.substring(0, 8)}</code></td>
                                 <td style="max-width:200px;overflow:hidden;text-overflow:ellipsis;white-space:nowrap" title="${s.first_message || ''}">${s.first_message || '-'}</td>
                                 <td>${s.updated_at ? new Date(s.updated_at).toLocaleString() : '-'}</td>
                                 <td><span class="badge badge-${s.status}">${s.status}</span></td>
+                                <td class="actions">
+                                    ${s.status !== 'dead'
+                                        ? `<a class="btn" href="/terminal.html?session=${s.session_id}&readonly=1">Watch</a>`
+                                        : ''}
+                                </td>
                             </tr>
                         `).join('')}
                 </tbody>
@@ -69,5 +100,28 @@ function renderSchedules(schedules) {
     `).join('');
 }
 
+function applyStatus(msg) {
+    // Session list changes are picked up by the next overview load.
+    if (msg.type === 'sessions') return;
+    const statuses = msg.type === 'snapshot' ? msg.sessions : msg.changed;
+    const removed = msg.type === 'snapshot' ? null : new Set(msg.removed);
+    let dirty = false;
+    for (const u of overviewUsers) {
+        for (const s of u.sessions) {
+            let status = statuses[s.session_id];
+            if (status === undefined && (removed === null || removed.has(s.session_id))) {
+                status = 'dead';
+            }
+            if (status !== undefined && s.status !== status) {
+                s.status = status;
+                dirty = true;
+            }
+        }
+    }
+    if (dirty) renderUsers(overviewUsers);
+}
+
 loadOverview();
-setInterval(loadOverview, 5000);
+subscribeStatus(applyStatus);
+// Status changes are pushed; the slow poll only picks up new sessions and schedules.
+setInterval(loadOverview, 30000);
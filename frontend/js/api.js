@@ -47,5 +47,21 @@ async function apiFetch(path, options = {}) {
 
 function getWsUrl(path) {
     const proto = location.protocol === 'https:' ? 'wss:' : 'ws:';
-    return `${proto}//${location.host}${path}?token=${getToken()}`;
+    const sep = path.includes('?') ? '&' : '?';
+    return `${proto}//${location.host}${path}${sep}token=${getToken()}`;
+}
+
+// Subscribe to server-pushed session status diffs; reconnects automatically.
+function subscribeStatus(onMessage) {
+    let ws = null;
+    function connect() {
+        ws = new WebSocket(getWsUrl('/api/ws/status'));
+        ws.onmessage = (event) => onMessage(JSON.parse(event.data));
+        ws.onclose = () => setTimeout(connect, 3000);
+    }
+    connect();
+    return () => {
+        ws.onclose = null;
+        ws.close();
+    };
 }
@@ -7,35 +7,95 @@ function logout() {
     window.location.href = '/index.html';
 }
 
+let sessions = [];
+let previews = {};
+
 async function loadSessions() {
     try {
-        const sessions = await apiFetch('/api/sessions');
-        const tbody = document.getElementById('sessionsBody');
-        if (sessions.length === 0) {
-            tbody.innerHTML = '<tr><td colspan="5" style="text-align:center;color:var(--text-muted)">No sessions yet</td></tr>';
-            return;
-        }
-        tbody.innerHTML = sessions.map(s => `
-            <tr>
-                <td><code>${s.session_id.substring(0, 8)}</code></td>
-                <td style="max-width:200px;overflow:hidden;text-overflow:ellipsis;white-space:nowrap" title="${s.first_message || ''}">${s.first_message || '-'}</td>
-                <td>${s.updated_at ? new Date(s.updated_at).toLocaleString() : '-'}</td>
-                <td><span class="badge badge-${s.status}">${s.status}</span></td>
-                <td class="actions">
-                    ${s.alive
-                        ? `<a class="btn" href="/terminal.html?session=${s.session_id}">Open</a>
-                           <button class="btn btn-danger" onclick="closeSession('${s.session_id}')">Close</button>`
-                        : `<button class="btn btn-success" onclick="resumeSession('${s.session_id}')">Resume</button>
-                           <button class="btn btn-danger" onclick="deleteSession('${s.session_id}')">Delete</button>`
-                    }
-                </td>
-            </tr>
-        `).join('');
+        sessions = await apiFetch('/api/sessions');
+        renderSessions();
+        loadPreviews();
     } catch (err) {
         console.error('Failed to load sessions:', err);
     }
 }
 
+function escapeHtml(text) {
+    return text.replace(/[&<>"']/g, c => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' }[c]));
+}
+
+// One batched request for the screen tail of the given live sessions (default: all).
+async function loadPreviews(ids) {
+    const live = new Set(sessions.filter(s => s.alive).map(s => s.session_id));
+    ids = ids ? ids.filter(id => live.has(id)) : [...live];
+    if (ids.length === 0) return;
+    try {
+        const fresh = await apiFetch('/api/sessions/previews', {
+            method: 'POST',
+            body: { session_ids: ids, lines: 4 },
+        });
+        previews = { ...previews, ...fresh };
+        renderSessions();
+    } catch (err) {
+        console.error('Failed to load previews:', err);
+    }
+}
+
+function renderSessions() {
+    const tbody = document.getElementById('sessionsBody');
+    if (sessions.length === 0) {
+        tbody.innerHTML = '<tr><td colspan="5" style="text-align:center;color:var(--text-muted)">No sessions yet</td></tr>';
+        return;
+    }
+    tbody.innerHTML = sessions.map(s => `
+        <tr>
+            <td><code>${s.session_id.substring(0, 8)}</code></td>
+            <td style="max-width:200px;overflow:hidden;text-overflow:ellipsis;white-space:nowrap" title="${s.first_message || ''}">${s.first_message || '-'}
+                ${s.alive && previews[s.session_id] ? `<pre class="preview">${escapeHtml(previews[s.session_id])}</pre>` : ''}</td>
+            <td>${s.updated_at ? new Date(s.updated_at).toLocaleString() : '-'}</td>
+            <td><span class="badge badge-${s.status}">${s.status}</span></td>
+            <td class="actions">
+                ${s.alive
+                    ? `<a class="btn" href="/terminal.html?session=${s.session_id}">Open</a>
+                       <button class="btn btn-danger" onclick="closeSession('${s.session_id}')">Close</button>`
+                    : s.status === 'evicted'
+                    ? `<a class="btn" href="/terminal.html?session=${s.session_id}">Open</a>
+                       <button class="btn btn-danger" onclick="deleteSession('${s.session_id}')">Delete</button>`
+                    : `<button class="btn btn-success" onclick="resumeSession('${s.session_id}')">Resume</button>
+                       <button class="btn btn-danger" onclick="deleteSession('${s.session_id}')">Delete</button>`
+                }
+            </td>
+        </tr>
+    `).join('');
+}
+
+function applyStatus(msg) {
+    if (msg.type === 'sessions') {
+        if (msg.users.includes(localStorage.getItem('uid'))) loadSessions();
+        return;
+    }
+    const statuses = msg.type === 'snapshot' ? msg.sessions : msg.changed;
+    const removed = msg.type === 'snapshot' ? null : new Set(msg.removed);
+    const changed = [];
+    for (const s of sessions) {
+        let status = statuses[s.session_id];
+        if (status === undefined && (removed === null || removed.has(s.session_id))) {
+            status = null;
+        }
+        if (status === undefined) continue;
+        const alive = status !== null;
+        const next = status || 'dead';
+        if (s.alive !== alive || s.status !== next) {
+            s.alive = alive;
+            s.status = next;
+            changed.push(s.session_id);
+        }
+    }
+    if (changed.length === 0) return;
+    renderSessions();
+    loadPreviews(changed);
+}
+
 async function createSession() {
     try {
         const data = await apiFetch('/api/sessions', { method: 'POST' });
@@ -75,4 +135,11 @@ async function deleteSession(id) {
 }
 
 loadSessions();
-setInterval(loadSessions, 5000);
+subscribeStatus(applyStatus);
+// Status and new/removed transcripts are pushed; the slow poll is a safety net.
+setInterval(loadSessions, 30000);
+// Previews follow status changes; only working sessions' screens move in between.
+setInterval(() => {
+    const working = sessions.filter(s => s.alive && s.status === 'working').map(s => s.session_id);
+    if (working.length) loadPreviews(working);
+}, 5000);
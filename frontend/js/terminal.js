@@ -2,15 +2,19 @@ if (!requireAuth()) throw new Error('Not authenticated');
 
 const params = new URLSearchParams(location.search);
 const sessionId = params.get('session');
+// Join as a watcher: output is shared, keystrokes and resizes are ignored
+const readonly = params.get('readonly') === '1';
 if (!sessionId) {
     window.location.href = '/dashboard.html';
     throw new Error('No session ID');
 }
 
-document.getElementById('sessionLabel').textContent = sessionId.substring(0, 8);
+document.getElementById('sessionLabel').textContent =
+    sessionId.substring(0, 8) + (readonly ? ' (read-only)' : '');
 
 const term = new Terminal({
-    cursorBlink: true,
+    cursorBlink: !readonly,
+    disableStdin: readonly,
     fontSize: 14,
     fontFamily: 'Menlo, Monaco, "Courier New", monospace',
     theme: {
@@ -26,9 +30,23 @@ term.open(document.getElementById('terminalContainer'));
 fitAddon.fit();
 
 let ws = null;
+let live = false;
+
+// Paint the last known screen right away; the attach redraws it once it arrives.
+async function paintSnapshot() {
+    try {
+        const snap = await apiFetch(`/api/sessions/${sessionId}/snapshot?scrollback=${term.rows * 4}`);
+        if (live) return;
+        term.write(snap.content.replace(/\n/g, '\r\n'));
+        const [x, y] = snap.cursor;
+        term.write(`\x1b[${y + 1};${x + 1}H`);
+    } catch (err) {
+        // No snapshot (session gone); the WebSocket reports the error.
+    }
+}
 
 function connect() {
-    const url = getWsUrl(`/api/ws/terminal/${sessionId}`);
+    const url = getWsUrl(`/api/ws/terminal/${sessionId}${readonly ? '?readonly=1' : ''}`);
     ws = new WebSocket(url);
     ws.binaryType = 'arraybuffer';
 
@@ -38,6 +56,7 @@ function connect() {
     };
 
     ws.onmessage = (event) => {
+        live = true;
         if (event.data instanceof ArrayBuffer) {
             term.write(new Uint8Array(event.data));
         } else {
@@ -72,7 +91,10 @@ function reconnect() {
     if (ws) {
         ws.close();
     }
+    live = false;
+    paintSnapshot();
     connect();
 }
 
+paintSnapshot();
 connect();